@@ -0,0 +1,12 @@
+# Copyright 2026 Camptocamp SA
+# License LGPL-3.0 or later (http://www.gnu.org/licenses/lgpl).
+"""Benchmarks for endpoints.
+
+They are not loaded w/ the module nor run w/ the tests.
+Run them from an Odoo shell, eg::
+
+    from odoo.addons.endpoint.benchmarks import eval_context
+    eval_context.main(env)
+
+Results are printed as JSON to be compared among runs.
+"""
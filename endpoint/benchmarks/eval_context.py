@@ -0,0 +1,73 @@
+# Copyright 2026 Camptocamp SA
+# License LGPL-3.0 or later (http://www.gnu.org/licenses/lgpl).
+"""Compare the cost of building code snippets' eval context per request.
+
+`rebuilt` builds the whole context on each call (as it used to be),
+`prebuilt` layers request values on top of the cached static part.
+"""
+
+import json
+import sys
+import time
+import tracemalloc
+
+from ..models.endpoint_mixin import CodeSnippetLogBuffer
+
+
+def measure(func, count):
+    """Return time and memory allocated per call of `func`."""
+    tracemalloc.start()
+    start = time.perf_counter()
+    for __ in range(count):
+        func()
+    elapsed = time.perf_counter() - start
+    __, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    # Each call releases its context: the peak is the cost of one call
+    return {"seconds_per_call": elapsed / count, "peak_bytes": peak}
+
+
+def run(env, count=10000):
+    endpoint = env["endpoint.endpoint"].new(
+        {"name": "Bench", "route": "/bench/eval_context", "exec_mode": "code"}
+    )
+    request = None
+
+    def rebuilt():
+        eval_ctx = endpoint._get_code_snippet_eval_context_static()
+        eval_ctx.update(
+            {
+                "env": endpoint.env,
+                "user": endpoint.env.user,
+                "endpoint": endpoint,
+                "request": request,
+                "log": CodeSnippetLogBuffer(
+                    endpoint, endpoint._code_snippet_log_max_entries
+                ),
+            }
+        )
+        return eval_ctx
+
+    def prebuilt():
+        return endpoint._get_code_snippet_eval_context(request)
+
+    # Warm up caches
+    rebuilt()
+    prebuilt()
+    res = {
+        "benchmark": "eval_context",
+        "count": count,
+        "rebuilt": measure(rebuilt, count),
+        "prebuilt": measure(prebuilt, count),
+    }
+    res["peak_bytes_saved"] = (
+        res["rebuilt"]["peak_bytes"] - res["prebuilt"]["peak_bytes"]
+    )
+    return res
+
+
+def main(env, count=10000):
+    res = run(env, count=count)
+    json.dump(res, sys.stdout, indent=2)
+    sys.stdout.write("\n")
+    return res
@@ -0,0 +1,90 @@
+# Copyright 2026 Camptocamp SA
+# License LGPL-3.0 or later (http://www.gnu.org/licenses/lgpl).
+"""Compare JSON encoders on a payload of order-like records.
+
+`legacy` is what snippets had to do before encoders handled dates
+and decimals: convert them, `json.dumps` and encode the result.
+Other entries are the encoders registered in `encoders`.
+"""
+
+import datetime
+import decimal
+import json
+import sys
+import time
+
+from .. import encoders
+
+
+def make_records(count=10000):
+    now = datetime.datetime(2026, 1, 1, 12, 30)
+    records = []
+    for i in range(count):
+        records.append(
+            {
+                "id": i,
+                "name": "SO%06d" % i,
+                "state": "sale",
+                "partner": {"id": i % 500, "name": "Partner %d" % (i % 500)},
+                "date_order": now - datetime.timedelta(minutes=i),
+                "commitment_date": (now + datetime.timedelta(days=i % 30)).date(),
+                "amount_total": decimal.Decimal("%d.%02d" % (i * 7, i % 100)),
+                "note": "Deliver at the back door, ring twice. Merci !",
+                "lines": [
+                    {
+                        "product": "Product %d" % (i * 3 + j),
+                        "qty": float(j + 1),
+                        "price_unit": decimal.Decimal("%d.50" % (j + 10)),
+                    }
+                    for j in range(3)
+                ],
+            }
+        )
+    return records
+
+
+def _legacy_convert(value):
+    if isinstance(value, dict):
+        return {k: _legacy_convert(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_legacy_convert(v) for v in value]
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    if isinstance(value, decimal.Decimal):
+        return float(value)
+    return value
+
+
+def legacy_dumps(value):
+    return json.dumps(_legacy_convert(value)).encode()
+
+
+def timed(func, value, repeat):
+    """Return the best time of `repeat` calls and the size of the output."""
+    best = None
+    for __ in range(repeat):
+        start = time.perf_counter()
+        data = func(value)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return {"seconds": round(best, 6), "bytes": len(data)}
+
+
+def run(count=10000, repeat=5):
+    records = make_records(count)
+    res = {
+        "benchmark": "json_encoder",
+        "count": count,
+        "default": encoders.get_encoder().__name__,
+        "legacy": timed(legacy_dumps, records, repeat),
+    }
+    for name, func in sorted(encoders._encoders.items()):
+        res[name] = timed(func, records, repeat)
+    return res
+
+
+def main(count=10000, repeat=5):
+    res = run(count=count, repeat=repeat)
+    json.dump(res, sys.stdout, indent=2)
+    sys.stdout.write("\n")
+    return res
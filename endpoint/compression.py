@@ -0,0 +1,74 @@
+# Copyright 2026 Camptocamp SA
+# License LGPL-3.0 or later (http://www.gnu.org/licenses/lgpl).
+"""Content encodings for endpoint responses.
+
+`gzip` is always available, `br` only when `brotli` is installed.
+"""
+
+import logging
+import zlib
+
+_logger = logging.getLogger(__name__)
+
+try:
+    import brotli
+except ImportError:
+    _logger.debug("`brotli` not installed, responses can only be gzipped")
+    brotli = None
+
+# Levels used when none is given.
+# Brotli's default (11) is too slow for dynamic content.
+DEFAULT_LEVELS = {"br": 4, "gzip": 6}
+# Min and max levels accepted by each encoding
+LEVEL_RANGES = {"br": (0, 11), "gzip": (-1, 9)}
+
+
+def _gzip_compressor(level):
+    # wbits=31: gzip header and trailer
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    return compressor.compress, compressor.flush
+
+
+def _brotli_compressor(level):
+    compressor = brotli.Compressor(quality=level)
+    return compressor.process, compressor.finish
+
+
+_compressors = {"gzip": _gzip_compressor}
+if brotli is not None:
+    _compressors["br"] = _brotli_compressor
+
+
+def available_encodings():
+    """Return supported encodings, by order of preference."""
+    return [encoding for encoding in ("br", "gzip") if encoding in _compressors]
+
+
+def level_range():
+    """Return the min and max levels valid for all the available encodings.
+
+    The encoding is negotiated w/ each client: a level must suit any of them.
+    """
+    ranges = [LEVEL_RANGES[encoding] for encoding in available_encodings()]
+    return max(low for low, __ in ranges), min(high for __, high in ranges)
+
+
+def _get_compressor(encoding, level=None):
+    return _compressors[encoding](level or DEFAULT_LEVELS[encoding])
+
+
+def compress(data, encoding, level=None):
+    """Return `data` compressed w/ given encoding."""
+    process, finish = _get_compressor(encoding, level=level)
+    return process(data) + finish()
+
+
+def compress_stream(chunks, encoding, level=None):
+    """Yield the compressed `chunks` w/ given encoding."""
+    process, finish = _get_compressor(encoding, level=level)
+    for chunk in chunks:
+        data = process(chunk)
+        # The compressor might buffer the whole chunk
+        if data:
+            yield data
+    yield finish()
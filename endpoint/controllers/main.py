@@ -3,6 +3,10 @@
 # License LGPL-3.0 or later (http://www.gnu.org/licenses/lgpl).
 
 
+import base64
+import csv
+import io
+import itertools
 import json
 
 from werkzeug.exceptions import NotFound
@@ -10,45 +14,272 @@ from werkzeug.exceptions import NotFound
 from odoo import http
 from odoo.http import Response, request
 
+from ..compression import available_encodings, compress, compress_stream
+from ..encoders import get_encoder
+from ..etag import CONDITIONAL_METHODS, etag_matches, make_etag
+
 
 class EndpointControllerMixin:
-    def _handle_endpoint(self, env, model, endpoint_route, **params):
-        endpoint = self._find_endpoint(env, model, endpoint_route)
+
+    # Min size of the chunks sent by streamed responses
+    _stream_chunk_size = 64 * 1024
+    # Name of the JSON encoder, see `encoders.get_encoder`
+    _json_encoder = None
+    # Generate ETags from the body of JSON responses to conditional requests
+    _etag_from_digest = True
+
+    def _handle_endpoint(self, env, model, endpoint_route, *args, **params):
+        # `args` might hold the endpoint id, see `_find_endpoint`
+        endpoint = self._find_endpoint(env, model, endpoint_route, *args)
         if not endpoint:
             raise NotFound()
         endpoint._validate_request(request)
         result = endpoint._handle_request(request)
-        return self._handle_result(result)
+        return self._handle_result(result, endpoint=endpoint)
 
-    def _handle_result(self, result):
+    def _handle_result(self, result, endpoint=None):
         response = result.get("response")
         if isinstance(response, Response):
             # Full response already provided
             return response
-        payload = result.get("payload", "")
+        resp = self._make_result_response(result)
+        if endpoint is not None and endpoint.response_compression:
+            resp = self._compress_response(
+                resp,
+                min_size=endpoint.response_compression_min_size,
+                level=endpoint.response_compression_level,
+            )
+        return resp
+
+    def _make_result_response(self, result):
         status = result.get("status_code", 200)
         headers = result.get("headers", {})
-        return self._make_json_response(payload, headers=headers, status=status)
+        etag = result.get("etag")
+        if etag is not None:
+            # Validator provided by the endpoint: no need to look at the payload
+            etag = make_etag(etag)
+            if etag_matches(request.httprequest, etag):
+                return self._make_not_modified_response(etag, headers=headers)
+        if "stream" in result:
+            resp = self._make_stream_response(
+                result["stream"],
+                stream_format=result.get("stream_format", "json"),
+                headers=headers,
+                status=status,
+            )
+            if etag is not None:
+                resp.set_etag(etag)
+            return resp
+        payload = result.get("payload", "")
+        return self._make_json_response(
+            payload, headers=headers, status=status, etag=etag
+        )
 
     # TODO: probably not needed anymore as controllers are automatically registered
-    def _make_json_response(self, payload, headers=None, status=200, **kw):
+    def _make_json_response(self, payload, headers=None, status=200, etag=None, **kw):
         # TODO: guess out type?
-        data = json.dumps(payload)
+        data = self._json_dumps(payload)
         if headers is None:
             headers = {}
         headers["Content-Type"] = "application/json"
+        if (
+            etag is None
+            and self._etag_from_digest
+            and status == 200
+            and request.httprequest.method in CONDITIONAL_METHODS
+        ):
+            etag = make_etag(data)
+            if etag_matches(request.httprequest, etag):
+                return self._make_not_modified_response(etag, headers=headers)
         resp = request.make_response(data, headers=headers)
         resp.status = str(status)
+        if etag is not None:
+            resp.set_etag(etag)
+        return resp
+
+    def _make_not_modified_response(self, etag, headers=None):
+        # Content headers are dropped by werkzeug
+        resp = Response(status=304, headers=headers)
+        resp.set_etag(etag)
+        return resp
+
+    def _compress_response(self, resp, min_size=0, level=None):
+        """Compress the response w/ the best encoding accepted by the client.
+
+        Streamed responses are compressed on the fly,
+        unless they are made of a single chunk smaller than `min_size`.
+        """
+        if resp.status_code in (204, 304) or "Content-Encoding" in resp.headers:
+            return resp
+        resp.vary.add("Accept-Encoding")
+        encoding = request.httprequest.accept_encodings.best_match(
+            available_encodings()
+        )
+        if not encoding:
+            return resp
+        if resp.direct_passthrough:
+            chunks = iter(resp.response)
+            first = next(chunks, b"")
+            chunks = itertools.chain([first], chunks)
+            # Chunks are smaller than `_stream_chunk_size` only if last
+            if len(first) < min(min_size, self._stream_chunk_size):
+                resp.response = chunks
+                return resp
+            resp.response = compress_stream(chunks, encoding, level=level)
+        else:
+            data = resp.get_data()
+            if len(data) < min_size:
+                return resp
+            resp.set_data(compress(data, encoding, level=level))
+        resp.headers["Content-Encoding"] = encoding
+        etag, weak = resp.get_etag()
+        if etag and not weak:
+            # Not the same bytes anymore
+            resp.set_etag(etag, weak=True)
+        return resp
+
+    def _check_job_access(self, job):
+        """Authenticate the request as done by the endpoint of given job.
+
+        Results of non public endpoints are only given to their requester.
+        """
+        endpoint = job._get_endpoint()
+        auth_type = endpoint.auth_type if endpoint else "user_endpoint"
+        if auth_type == "public":
+            return
+        getattr(request.env["ir.http"], "_auth_method_" + auth_type)()
+        if request.uid != job.user_id.id:
+            # Do not disclose the existence of the job
+            raise NotFound()
+
+    def _make_job_response(self, job):
+        """Return the result of given `endpoint.job` or its state."""
+        if job.state != "done":
+            payload = {"job": job.token, "state": job.state}
+            status = 202
+            if job.state == "failed":
+                status = job.result_status or 500
+                # Do not disclose internal errors
+                if status < 500:
+                    payload["error"] = job.error
+            return self._make_json_response(payload, status=status)
+        resp = Response(
+            base64.b64decode(job.result_body or b""),
+            status=job.result_status,
+            headers=json.loads(job.result_headers or "{}"),
+        )
+        endpoint = job._get_endpoint()
+        if endpoint.response_compression:
+            resp = self._compress_response(
+                resp,
+                min_size=endpoint.response_compression_min_size,
+                level=endpoint.response_compression_level,
+            )
         return resp
 
-    def _find_endpoint(self, env, model, endpoint_route):
-        return env[model]._find_endpoint(endpoint_route)
+    def _json_dumps(self, value):
+        """Return `value` encoded as JSON bytes."""
+        return get_encoder(self._json_encoder)(value)
+
+    def _stream_formats(self):
+        """Return streaming formats as `{format: (content type, encoder)}`.
+
+        Encoders receive the items of the stream and yield bytes.
+        """
+        return {
+            "json": ("application/json", self._stream_encode_json),
+            "ndjson": ("application/x-ndjson", self._stream_encode_ndjson),
+            "csv": ("text/csv", self._stream_encode_csv),
+        }
+
+    def _make_stream_response(
+        self, items, stream_format="json", headers=None, status=200
+    ):
+        """Stream given items w/o building the whole body in memory.
+
+        :param items: iterable of items (rows for CSV)
+        :param stream_format: one of the keys of `_stream_formats`
+        """
+        try:
+            content_type, encoder = self._stream_formats()[stream_format]
+        except KeyError:
+            raise ValueError("Unsupported stream format: %s" % stream_format)
+        headers = dict(headers or {})
+        headers["Content-Type"] = content_type
+        return Response(
+            self._stream_chunks(encoder(items)),
+            headers=headers,
+            status=status,
+            direct_passthrough=True,
+        )
 
-    def auto_endpoint(self, model, endpoint_route, **params):
+    def _stream_chunks(self, parts):
+        """Group small parts in chunks of at least `_stream_chunk_size` bytes."""
+        chunk = []
+        size = 0
+        for part in parts:
+            chunk.append(part)
+            size += len(part)
+            if size >= self._stream_chunk_size:
+                yield b"".join(chunk)
+                chunk = []
+                size = 0
+        if chunk:
+            yield b"".join(chunk)
+
+    def _stream_encode_json(self, items):
+        dumps = get_encoder(self._json_encoder)
+        yield b"["
+        sep = b""
+        for item in items:
+            yield sep + dumps(item)
+            sep = b","
+        yield b"]"
+
+    def _stream_encode_ndjson(self, items):
+        dumps = get_encoder(self._json_encoder)
+        for item in items:
+            yield dumps(item) + b"\n"
+
+    def _stream_encode_csv(self, rows):
+        buf = io.StringIO()
+        writer = csv.writer(buf)
+        for row in rows:
+            writer.writerow(row)
+            yield buf.getvalue().encode()
+            buf.seek(0)
+            buf.truncate()
+
+    def _find_endpoint(self, env, model, endpoint_route, endpoint_id=None):
+        return env[model]._find_endpoint(endpoint_route, endpoint_id=endpoint_id)
+
+    def auto_endpoint(self, model, endpoint_route, *args, **params):
         """Default method to handle auto-generated endpoints"""
+        # NOTE: the endpoint id is passed positionally via `default_pargs`
+        # (rules registered before it was added don't have it)
+        # so that it can't be overridden by request params.
         env = request.env
-        return self._handle_endpoint(env, model, endpoint_route, **params)
+        return self._handle_endpoint(env, model, endpoint_route, *args, **params)
 
 
 class EndpointController(http.Controller, EndpointControllerMixin):
-    pass
+    @http.route(
+        "/endpoint/job/<string:token>",
+        type="http",
+        auth="public",
+        methods=["GET"],
+        csrf=False,
+    )
+    def endpoint_job(self, token, **params):
+        """Return the result of a deferred endpoint, see `endpoint.job`.
+
+        The route is public as the endpoint might be,
+        see `_check_job_access` for the others.
+        """
+        job = (
+            request.env["endpoint.job"].sudo().search([("token", "=", token)], limit=1)
+        )
+        if not job:
+            raise NotFound()
+        self._check_job_access(job)
+        return self._make_job_response(job)
@@ -0,0 +1,63 @@
+# Copyright 2026 Camptocamp SA
+# License LGPL-3.0 or later (http://www.gnu.org/licenses/lgpl).
+"""JSON encoders producing bytes for endpoint responses.
+
+`orjson` is used when installed, stdlib `json` otherwise.
+Both encoders produce the same compact output
+and handle `datetime`, `date` (ISO 8601) and `Decimal` (as float) natively.
+
+Other encoders can be plugged via `register_encoder`.
+"""
+
+import datetime
+import decimal
+import json
+import logging
+
+_logger = logging.getLogger(__name__)
+
+try:
+    import orjson
+except ImportError:
+    _logger.debug("`orjson` not installed, using stdlib `json`")
+    orjson = None
+
+_encoders = {}
+
+
+def register_encoder(name, func):
+    """Register `func(obj) -> bytes` as JSON encoder `name`."""
+    _encoders[name] = func
+
+
+def get_encoder(name=None):
+    """Return the encoder registered as `name`, by default the fastest one."""
+    if name is None:
+        name = "orjson" if "orjson" in _encoders else "json"
+    return _encoders[name]
+
+
+def json_default(obj):
+    """Serialize values not handled by the encoders."""
+    if isinstance(obj, (datetime.datetime, datetime.date)):
+        return obj.isoformat()
+    if isinstance(obj, decimal.Decimal):
+        return float(obj)
+    raise TypeError("Object of type %s is not JSON serializable" % type(obj).__name__)
+
+
+def dumps_json(obj):
+    return json.dumps(
+        obj, default=json_default, ensure_ascii=False, separators=(",", ":")
+    ).encode()
+
+
+register_encoder("json", dumps_json)
+
+if orjson is not None:
+
+    def dumps_orjson(obj):
+        # Datetimes are serialized natively w/ the same format
+        return orjson.dumps(obj, default=json_default, option=orjson.OPT_NON_STR_KEYS)
+
+    register_encoder("orjson", dumps_orjson)
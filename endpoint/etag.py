@@ -0,0 +1,30 @@
+# Copyright 2026 Camptocamp SA
+# License LGPL-3.0 or later (http://www.gnu.org/licenses/lgpl).
+"""ETag helpers for conditional GET requests on endpoints."""
+
+import hashlib
+
+from werkzeug.http import parse_etags
+
+# Methods for which `If-None-Match` is answered w/ 304
+CONDITIONAL_METHODS = ("GET", "HEAD")
+
+
+def make_etag(value):
+    """Return the ETag of `value`: raw bytes (eg: a body) or any validator.
+
+    Validators (eg: a max `write_date`) are converted to string.
+    """
+    if not isinstance(value, bytes):
+        value = str(value).encode()
+    return hashlib.sha1(value).hexdigest()
+
+
+def etag_matches(httprequest, etag):
+    """Tell if `etag` matches the `If-None-Match` header of the request."""
+    if httprequest.method not in CONDITIONAL_METHODS:
+        return False
+    header = httprequest.headers.get("If-None-Match")
+    if not header:
+        return False
+    return parse_etags(header).contains_weak(etag)
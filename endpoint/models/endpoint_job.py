@@ -0,0 +1,238 @@
+# Copyright 2026 Camptocamp SA
+# License LGPL-3.0 or later (http://www.gnu.org/licenses/lgpl).
+
+import base64
+import json
+import logging
+import threading
+import uuid
+
+from werkzeug.exceptions import HTTPException
+
+from odoo import _, api, exceptions, fields, http, models
+from odoo.tools import DotDict, date_utils
+
+from ..encoders import get_encoder
+
+_logger = logging.getLogger(__name__)
+
+
+class EndpointJob(models.Model):
+    """Request to a deferred endpoint, executed in background."""
+
+    _name = "endpoint.job"
+    _description = "Endpoint job"
+    _order = "id desc"
+
+    # Jobs processed per cron run
+    _cron_batch_size = 10
+    # Days done and failed jobs are kept
+    _gc_days = 7
+    # Minutes after which running jobs not locked anymore are failed,
+    # see `_fail_stale_jobs`
+    _running_timeout = 60
+
+    token = fields.Char(
+        required=True,
+        readonly=True,
+        index=True,
+        copy=False,
+        default=lambda self: uuid.uuid4().hex,
+    )
+    res_model = fields.Char(string="Endpoint model", required=True, readonly=True)
+    res_id = fields.Many2oneReference(
+        string="Endpoint ID", model_field="res_model", required=True, readonly=True
+    )
+    user_id = fields.Many2one(
+        comodel_name="res.users",
+        required=True,
+        readonly=True,
+        help="User who made the request, the only one allowed to get its result "
+        "unless the endpoint is public.",
+    )
+    state = fields.Selection(
+        selection=[
+            ("pending", "Pending"),
+            ("running", "Running"),
+            ("done", "Done"),
+            ("failed", "Failed"),
+        ],
+        default="pending",
+        required=True,
+        readonly=True,
+        index=True,
+    )
+    date_done = fields.Datetime(readonly=True)
+    request_method = fields.Char(readonly=True)
+    request_path = fields.Char(readonly=True)
+    request_params = fields.Text(readonly=True)
+    request_content_type = fields.Char(readonly=True)
+    request_body = fields.Binary(attachment=False, readonly=True)
+    result_status = fields.Integer(readonly=True)
+    result_headers = fields.Text(readonly=True)
+    result_body = fields.Binary(attachment=True, readonly=True)
+    error = fields.Text(readonly=True)
+
+    @api.model
+    def _enqueue(self, endpoint, request):
+        """Record given request to `endpoint` and wake up the runner."""
+        httprequest = request.httprequest
+        # Uploaded files and the like are not kept
+        params = {k: v for k, v in request.params.items() if isinstance(v, str)}
+        job = self.create(
+            {
+                "res_model": endpoint._name,
+                "res_id": endpoint.id,
+                # Not the user of `endpoint`, which might be `exec_as_user_id`
+                "user_id": request.env.uid,
+                "request_method": httprequest.method,
+                "request_path": httprequest.path,
+                "request_params": json.dumps(params),
+                "request_content_type": httprequest.content_type,
+                "request_body": base64.b64encode(httprequest.get_data()),
+            }
+        )
+        self.env.ref("endpoint.cron_endpoint_job_run").sudo()._trigger()
+        return job
+
+    def _status_url(self):
+        return "/endpoint/job/%s" % self.token
+
+    def _get_endpoint(self):
+        return self.env[self.res_model].browse(self.res_id).exists()
+
+    def _get_request(self):
+        """Return a stand-in for the recorded request."""
+        params = json.loads(self.request_params or "{}")
+        return DotDict(
+            {
+                "params": params,
+                "httprequest": {
+                    "method": self.request_method,
+                    "path": self.request_path,
+                    "args": params,
+                    "content_type": self.request_content_type,
+                    "headers": {"Content-Type": self.request_content_type},
+                    "data": base64.b64decode(self.request_body or b""),
+                },
+            }
+        )
+
+    @api.model
+    def _cron_run(self):
+        self._fail_stale_jobs()
+        for __ in range(self._cron_batch_size):
+            self.env.cr.execute(
+                """
+                SELECT id FROM endpoint_job
+                WHERE state = 'pending'
+                ORDER BY id
+                LIMIT 1
+                FOR UPDATE SKIP LOCKED
+                """
+            )
+            row = self.env.cr.fetchone()
+            if not row:
+                return
+            job = self.browse(row[0])
+            job.state = "running"
+            self._commit()
+            job._lock()
+            job._run()
+            self._commit()
+        # More jobs might be waiting
+        self.env.ref("endpoint.cron_endpoint_job_run")._trigger()
+
+    def _lock(self):
+        """Lock the jobs until the end of the transaction."""
+        self.env.cr.execute(
+            "SELECT id FROM endpoint_job WHERE id IN %s FOR UPDATE", (tuple(self.ids),)
+        )
+
+    @api.model
+    def _fail_stale_jobs(self):
+        """Fail the jobs left running by a dead worker.
+
+        Jobs are locked while running: the ones not locked anymore
+        and not updated since `_running_timeout` minutes are stuck.
+        They are not run again as they might be the cause of the failure.
+        """
+        date = date_utils.subtract(fields.Datetime.now(), minutes=self._running_timeout)
+        self.env.cr.execute(
+            """
+            SELECT id FROM endpoint_job
+            WHERE state = 'running' AND write_date < %s
+            FOR UPDATE SKIP LOCKED
+            """,
+            (date,),
+        )
+        jobs = self.browse([row[0] for row in self.env.cr.fetchall()])
+        if not jobs:
+            return
+        _logger.warning("Endpoint jobs %s interrupted, set as failed", jobs.ids)
+        jobs.write(
+            {
+                "state": "failed",
+                "error": _("Job interrupted"),
+                "result_status": 500,
+                "date_done": fields.Datetime.now(),
+            }
+        )
+        self._commit()
+
+    def _commit(self):
+        if not getattr(threading.current_thread(), "testing", False):
+            self.env.cr.commit()  # pylint: disable=invalid-commit
+
+    def _run(self):
+        """Execute the endpoint w/ the recorded request and store the result."""
+        self.ensure_one()
+        endpoint = self._get_endpoint()
+        try:
+            if not endpoint:
+                raise exceptions.UserError(_("Endpoint not found"))
+            endpoint = endpoint.with_user(self.user_id).with_context(
+                endpoint_job_run=True
+            )
+            with self.env.cr.savepoint():
+                result = endpoint._handle_request(self._get_request())
+                vals = self._prepare_result_values(result)
+        except Exception as exc:
+            _logger.exception("Endpoint job %s failed", self.id)
+            vals = {
+                "state": "failed",
+                "error": str(exc),
+                "result_status": exc.code if isinstance(exc, HTTPException) else 500,
+            }
+        vals["date_done"] = fields.Datetime.now()
+        self.write(vals)
+
+    def _prepare_result_values(self, result):
+        response = result.get("response")
+        if isinstance(response, http.Response):
+            body = response.get_data()
+            status = response.status_code
+            headers = {"Content-Type": response.content_type}
+        elif "stream" in result:
+            raise exceptions.UserError(
+                _("Streams are not supported by deferred endpoints")
+            )
+        else:
+            body = get_encoder()(result.get("payload", ""))
+            status = result.get("status_code", 200)
+            headers = dict(result.get("headers", {}))
+            headers["Content-Type"] = "application/json"
+        return {
+            "state": "done",
+            "result_status": status,
+            "result_headers": json.dumps(headers),
+            "result_body": base64.b64encode(body),
+        }
+
+    @api.autovacuum
+    def _gc_jobs(self):
+        """Drop old jobs along w/ their results."""
+        date = date_utils.subtract(fields.Datetime.now(), days=self._gc_days)
+        self.sudo().search(
+            [("state", "in", ("done", "failed")), ("date_done", "<", date)]
+        ).unlink()
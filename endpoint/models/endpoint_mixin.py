@@ -2,15 +2,95 @@
 # @author: Simone Orsi <simone.orsi@camptocamp.com>
 # License LGPL-3.0 or later (http://www.gnu.org/licenses/lgpl).
 
+import functools
+import hashlib
 import textwrap
+from types import MappingProxyType
 
 import werkzeug
+from psycopg2 import OperationalError
+from psycopg2.extras import execute_values
 
-from odoo import _, api, exceptions, fields, http, models
-from odoo.tools import safe_eval
+from odoo import _, api, exceptions, fields, http, models, tools
+from odoo.tools import safe_eval, ustr
 
 from odoo.addons.rpc_helper.decorator import disable_rpc
 
+from ..compression import level_range
+from ..etag import etag_matches, make_etag
+
+
+class CodeSnippetLogBuffer:
+    """`log` function of code snippets, buffering entries in memory.
+
+    Entries are written at once by `flush`. Past `max_entries`
+    entries are dropped and only their count is logged.
+    """
+
+    def __init__(self, endpoint, max_entries):
+        self._endpoint = endpoint
+        self._max_entries = max_entries
+        self._entries = []
+        self._dropped = 0
+
+    def __call__(self, message, level="info"):
+        if len(self._entries) >= self._max_entries:
+            self._dropped += 1
+            return
+        self._entries.append((level, message))
+
+    def flush(self):
+        entries, self._entries = self._entries, []
+        if self._dropped:
+            entries.append(
+                (
+                    "warning",
+                    "%d log entries dropped, max %d per request"
+                    % (self._dropped, self._max_entries),
+                )
+            )
+            self._dropped = 0
+        if entries:
+            self._endpoint._code_snippet_log_write(entries)
+
+
+class ReadOnlyModule:
+    """Expose given attributes of a module, w/o allowing to change them.
+
+    Same as `safe_eval.wrap_module` but immutable,
+    hence the same instance can be shared among evaluation contexts.
+    """
+
+    __slots__ = ("_name", "_attrs")
+
+    def __init__(self, module, attributes):
+        if isinstance(attributes, dict):
+            attrs = {
+                name: ReadOnlyModule(getattr(module, name), sub)
+                if sub
+                else getattr(module, name)
+                for name, sub in attributes.items()
+            }
+        else:
+            attrs = {name: getattr(module, name) for name in attributes}
+        object.__setattr__(self, "_name", module.__name__)
+        object.__setattr__(self, "_attrs", MappingProxyType(attrs))
+
+    def __getattr__(self, name):
+        try:
+            return self._attrs[name]
+        except KeyError:
+            raise AttributeError(name)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("%s is read-only" % self._name)
+
+    def __delattr__(self, name):
+        raise AttributeError("%s is read-only" % self._name)
+
+    def __repr__(self):
+        return "<read-only %r>" % self._name
+
 
 @disable_rpc()  # Block ALL RPC calls
 class EndpointMixin(models.AbstractModel):
@@ -18,6 +98,8 @@ class EndpointMixin(models.AbstractModel):
     _name = "endpoint.mixin"
     _inherit = "endpoint.route.handler"
     _description = "Endpoint mixin"
+    # Max number of `log` entries kept per request by code snippets
+    _code_snippet_log_max_entries = 1000
 
     exec_mode = fields.Selection(
         selection="_selection_exec_mode",
@@ -30,9 +112,21 @@ class EndpointMixin(models.AbstractModel):
     )
     exec_as_user_id = fields.Many2one(comodel_name="res.users")
     company_id = fields.Many2one("res.company", string="Company")
+    response_compression = fields.Boolean(
+        help="Compress responses w/ brotli or gzip, as accepted by the client."
+    )
+    response_compression_min_size = fields.Integer(
+        default=1024,
+        help="Responses smaller than this size (bytes) are not compressed.",
+    )
+    response_compression_level = fields.Integer(
+        help="Leave empty to use the default level. "
+        "The encoding depends on the client: the level must be valid "
+        "for gzip (-1 to 9) and brotli (0 to 11) if installed."
+    )
 
     def _selection_exec_mode(self):
-        return [("code", "Execute code")]
+        return [("code", "Execute code"), ("deferred", "Execute code in background")]
 
     def _compute_code_snippet_docs(self):
         for rec in self:
@@ -53,6 +147,9 @@ class EndpointMixin(models.AbstractModel):
                 _("Exec mode is set to `Code`: you must provide a piece of code")
             )
 
+    def _validate_exec__deferred(self):
+        self._validate_exec__code()
+
     @api.constrains("auth_type")
     def _check_auth(self):
         for rec in self:
@@ -61,6 +158,16 @@ class EndpointMixin(models.AbstractModel):
                     _("'Exec as user' is mandatory for public endpoints.")
                 )
 
+    @api.constrains("response_compression_level")
+    def _check_response_compression_level(self):
+        low, high = level_range()
+        for rec in self:
+            level = rec.response_compression_level
+            if level and not low <= level <= high:
+                raise exceptions.UserError(
+                    _("Compression level must be between %s and %s.") % (low, high)
+                )
+
     def _default_code_snippet_docs(self):
         return """
         Available vars:
@@ -85,7 +192,33 @@ class EndpointMixin(models.AbstractModel):
 
         which are all optional.
 
+        Big results can be streamed by generating instead:
+
+        * stream: iterable of items (rows for CSV)
+          or a function receiving ``env`` and returning it
+          (use a function to read records while streaming)
+        * stream_format: ``json`` (default), ``ndjson`` or ``csv``
+
+        GET requests are answered w/ "304 Not Modified" when the ETag
+        of the payload matches the "If-None-Match" header.
+        To skip computing the payload, generate a cheap validator
+        (eg: the max ``write_date``) into ``etag``:
+
+            validator = ...
+            result = {"etag": validator}
+            if not etag_matches(validator):
+                result["payload"] = ...
+
+        In "Execute code in background" exec mode, the request is answered
+        w/ "202 Accepted" and the URL where to get the result,
+        once the code is executed. Unless the endpoint is public,
+        only the user who made the request can get it.
+        Results cannot be streamed and
+        ``request`` only provides ``params`` and ``httprequest``
+        (method, path, args, content_type, headers and data).
+
         Use ``log`` function to log messages into ir.logging table.
+        Messages are written at the end of the execution.
         """
 
     def _get_code_snippet_eval_context(self, request):
@@ -93,60 +226,161 @@ class EndpointMixin(models.AbstractModel):
 
         :returns: dict -- evaluation context given to safe_eval
         """
+        eval_ctx = dict(self._get_code_snippet_eval_context_base())
+        eval_ctx.update(
+            {
+                "env": self.env,
+                "user": self.env.user,
+                "endpoint": self,
+                "request": request,
+                "log": CodeSnippetLogBuffer(self, self._code_snippet_log_max_entries),
+                "etag_matches": functools.partial(
+                    self._code_snippet_etag_matches, request
+                ),
+            }
+        )
+        return eval_ctx
+
+    def _code_snippet_etag_matches(self, request, validator):
+        return etag_matches(request.httprequest, make_etag(validator))
+
+    @tools.ormcache()
+    def _get_code_snippet_eval_context_base(self):
+        """Return the read-only part of the context not depending on the request.
+
+        Built once per process, see `_get_code_snippet_eval_context_static`.
+        """
+        return MappingProxyType(self._get_code_snippet_eval_context_static())
+
+    def _get_code_snippet_eval_context_static(self):
+        """Prepare the values of the context not depending on the request.
+
+        Values are shared by all evaluations: they must be immutable.
+        `datetime`, `dateutil`, `time` and `json` are the wrappers
+        shared by all `safe_eval` calls.
+        """
         return {
-            "env": self.env,
-            "user": self.env.user,
-            "endpoint": self,
-            "request": request,
             "datetime": safe_eval.datetime,
             "dateutil": safe_eval.dateutil,
             "time": safe_eval.time,
             "json": safe_eval.json,
             "Response": http.Response,
-            "werkzeug": safe_eval.wrap_module(
+            "werkzeug": ReadOnlyModule(
                 werkzeug, {"exceptions": ["NotFound", "BadRequest", "Unauthorized"]}
             ),
-            "exceptions": safe_eval.wrap_module(
-                exceptions, ["UserError", "ValidationError"]
-            ),
-            "log": self._code_snippet_log_func,
+            "exceptions": ReadOnlyModule(exceptions, ["UserError", "ValidationError"]),
         }
 
-    def _code_snippet_log_func(self, message, level="info"):
+    def _code_snippet_log_write(self, entries):
+        """Write given `(level, message)` entries into `ir.logging` at once.
+
+        A separate cursor is used to keep them even if the request fails.
+        """
         # Almost barely copied from ir.actions.server
+        rows = [
+            (
+                self.env.uid,
+                "server",
+                self._cr.dbname,
+                __name__,
+                level,
+                message,
+                "endpoint",
+                self.id,
+                self.name,
+            )
+            for level, message in entries
+        ]
         with self.pool.cursor() as cr:
-            cr.execute(
+            execute_values(
+                cr,
                 """
                 INSERT INTO ir_logging
                 (create_date, create_uid, type, dbname, name, level, message, path, line, func)
-                VALUES (NOW() at time zone 'UTC', %s, %s, %s, %s, %s, %s, %s, %s, %s)
-            """,
-                (
-                    self.env.uid,
-                    "server",
-                    self._cr.dbname,
-                    __name__,
-                    level,
-                    message,
-                    "endpoint",
-                    self.id,
-                    self.name,
-                ),
+                VALUES %s
+                """,
+                rows,
+                template="(NOW() at time zone 'UTC', %s, %s, %s, %s, %s, %s, %s, %s, %s)",
+                page_size=len(rows),
+            )
+
+    def _get_code_snippet_code(self):
+        """Return the code snippet validated and compiled as `safe_eval` does.
+
+        Compiled code is cached per registry, keyed on the snippet's digest,
+        hence each snippet is checked and compiled only once.
+        """
+        snippet = self.code_snippet
+        digest = hashlib.sha1(snippet.encode()).hexdigest()
+        return self._compile_code_snippet(digest, snippet)
+
+    @tools.ormcache("digest")
+    def _compile_code_snippet(self, digest, snippet):
+        # Keep in sync w/ `odoo.tools.safe_eval.safe_eval`
+        return safe_eval.test_expr(snippet, safe_eval._SAFE_OPCODES, mode="exec")
+
+    def _eval_code_snippet(self, eval_ctx):
+        """Execute the code snippet in given context.
+
+        Same as `safe_eval(snippet, eval_ctx, mode="exec", nocopy=True)`
+        but w/ the cached compiled code.
+        """
+        # Keep in sync w/ `odoo.tools.safe_eval.safe_eval`
+        code = self._get_code_snippet_code()
+        safe_eval.check_values(eval_ctx)
+        eval_ctx["__builtins__"] = safe_eval._BUILTINS
+        try:
+            safe_eval.unsafe_eval(code, eval_ctx)
+        except (
+            exceptions.UserError,
+            exceptions.RedirectWarning,
+            werkzeug.exceptions.HTTPException,
+            http.AuthenticationError,
+            OperationalError,
+            ZeroDivisionError,
+        ):
+            raise
+        except Exception as e:
+            raise ValueError(
+                '%s: "%s" while evaluating\n%r'
+                % (ustr(type(e)), ustr(e), self.code_snippet)
             )
 
     def _handle_exec__code(self, request):
         if not self._code_snippet_valued():
             return {}
         eval_ctx = self._get_code_snippet_eval_context(request)
-        snippet = self.code_snippet
-        safe_eval.safe_eval(snippet, eval_ctx, mode="exec", nocopy=True)
+        # The snippet might override `log`: keep track of the buffer
+        log = eval_ctx["log"]
+        try:
+            self._eval_code_snippet(eval_ctx)
+        finally:
+            log.flush()
         result = eval_ctx.get("result")
         if not isinstance(result, dict):
             raise exceptions.UserError(
                 _("code_snippet should return a dict into `result` variable.")
             )
+        if callable(result.get("stream")):
+            # `log` might be called while streaming
+            result["stream"] = self._iter_stream(result["stream"], log=log)
         return result
 
+    def _handle_exec__deferred(self, request):
+        """Record the request and reply w/ the URL to get its result.
+
+        The code snippet is executed later on by `endpoint.job`.
+        """
+        if self.env.context.get("endpoint_job_run"):
+            return self._handle_exec__code(request)
+        job = self.env["endpoint.job"].sudo()._enqueue(self, request)
+        status_url = job._status_url()
+        return {
+            "status_code": 202,
+            "payload": {"job": job.token, "state": job.state, "url": status_url},
+            "headers": {"Location": status_url},
+        }
+
     def _code_snippet_valued(self):
         snippet = self.code_snippet or ""
         return bool(
@@ -161,7 +395,8 @@ class EndpointMixin(models.AbstractModel):
         return {
             "klass_dotted_path": "odoo.addons.endpoint.controllers.main.EndpointController",
             "method_name": "auto_endpoint",
-            "default_pargs": (self._name, self.route),
+            # The id saves the lookup of the endpoint on each call
+            "default_pargs": (self._name, self.route, self._origin.id or None),
         }
 
     def _validate_request(self, request):
@@ -195,14 +430,47 @@ class EndpointMixin(models.AbstractModel):
         except self._bad_request_exceptions() as orig_exec:
             self._logger.error("_validate_request: BadRequest")
             raise werkzeug.exceptions.BadRequest() from orig_exec
+        if callable(res.get("stream")):
+            res["stream"] = self_with_user._iter_stream(res["stream"])
         return res
 
+    def _iter_stream(self, func, log=None):
+        """Yield the items returned by `func(env)` using a dedicated cursor.
+
+        Streamed responses are consumed once the request's cursor is closed,
+        out of the request's `api.Environment.manage()` block.
+
+        :param log: `CodeSnippetLogBuffer` to flush once the stream is over
+        """
+        try:
+            with api.Environment.manage(), self.pool.cursor() as cr:
+                env = api.Environment(cr, self.env.uid, self.env.context)
+                yield from func(env)
+        finally:
+            # Not on the stream's cursor: entries are kept if the stream fails
+            if log is not None:
+                log.flush()
+
     def _bad_request_exceptions(self):
         return (exceptions.UserError, exceptions.ValidationError)
 
     @api.model
-    def _find_endpoint(self, endpoint_route):
-        return self.sudo().search(self._find_endpoint_domain(endpoint_route), limit=1)
+    def _find_endpoint(self, endpoint_route, endpoint_id=None):
+        """Find the endpoint matching given route.
+
+        :param endpoint_id: id of the endpoint carried by the routing rule.
+            If given, the endpoint is browsed and checked against the domain
+            in memory w/o searching for it.
+        """
+        domain = self._find_endpoint_domain(endpoint_route)
+        if endpoint_id:
+            if self._active_name and self.env.context.get("active_test", True):
+                domain = domain + [(self._active_name, "=", True)]
+            try:
+                return self.sudo().browse(endpoint_id).filtered_domain(domain)
+            except exceptions.MissingError:
+                return self.browse()
+        return self.sudo().search(domain, limit=1)
 
     def _find_endpoint_domain(self, endpoint_route):
         return [("route", "=", endpoint_route)]
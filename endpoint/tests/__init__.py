@@ -1,2 +1,5 @@
 from . import test_endpoint
 from . import test_endpoint_controller
+from . import test_encoders
+from . import test_compression
+from . import test_endpoint_job
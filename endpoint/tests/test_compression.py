@@ -0,0 +1,39 @@
+# Copyright 2026 Camptocamp SA
+# License LGPL-3.0 or later (http://www.gnu.org/licenses/lgpl).
+
+import gzip
+
+from odoo.tests.common import BaseCase
+
+from .. import compression
+
+
+class TestCompression(BaseCase):
+    def test_available_encodings(self):
+        expected = ["br", "gzip"] if compression.brotli else ["gzip"]
+        self.assertEqual(compression.available_encodings(), expected)
+
+    def test_gzip(self):
+        data = b'{"id":1,"name":"Item"}' * 1000
+        compressed = compression.compress(data, "gzip")
+        self.assertLess(len(compressed), len(data))
+        self.assertEqual(gzip.decompress(compressed), data)
+        compressed = b"".join(
+            compression.compress_stream([data[:1000], data[1000:]], "gzip", level=9)
+        )
+        self.assertEqual(gzip.decompress(compressed), data)
+
+    def test_brotli(self):
+        if not compression.brotli:
+            self.skipTest("`brotli` not installed")
+        data = b'{"id":1,"name":"Item"}' * 1000
+        decompress = compression.brotli.decompress
+        self.assertEqual(decompress(compression.compress(data, "br")), data)
+        compressed = b"".join(
+            compression.compress_stream([data[:1000], data[1000:]], "br", level=1)
+        )
+        self.assertEqual(decompress(compressed), data)
+
+    def test_level_range(self):
+        expected = (0, 9) if compression.brotli else (-1, 9)
+        self.assertEqual(compression.level_range(), expected)
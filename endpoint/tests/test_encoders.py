@@ -0,0 +1,55 @@
+# Copyright 2026 Camptocamp SA
+# License LGPL-3.0 or later (http://www.gnu.org/licenses/lgpl).
+
+import datetime
+import decimal
+import json
+
+from odoo.tests.common import BaseCase
+
+from .. import encoders
+from ..benchmarks import json_encoder
+
+
+class TestEncoders(BaseCase):
+    def test_encoders(self):
+        value = {
+            "name": "Café",
+            "date": datetime.date(2026, 1, 2),
+            "datetime": datetime.datetime(2026, 1, 2, 3, 4, 5),
+            "amount": decimal.Decimal("1.10"),
+            1: [None, True, 1.5],
+        }
+        expected = (
+            '{"name":"Café","date":"2026-01-02","datetime":"2026-01-02T03:04:05",'
+            '"amount":1.1,"1":[null,true,1.5]}'
+        ).encode()
+        for name, func in encoders._encoders.items():
+            with self.subTest(encoder=name):
+                self.assertEqual(func(value), expected)
+                with self.assertRaises(TypeError):
+                    func({"foo": object()})
+
+    def test_get_encoder(self):
+        expected = "orjson" if encoders.orjson else "json"
+        self.assertIs(encoders.get_encoder(), encoders._encoders[expected])
+        self.assertIs(encoders.get_encoder("json"), encoders.dumps_json)
+
+    def test_register_encoder(self):
+        def dumps(value):
+            return json.dumps(value, indent=2).encode()
+
+        encoders.register_encoder("test", dumps)
+        try:
+            self.assertEqual(encoders.get_encoder("test")([1]), b"[\n  1\n]")
+        finally:
+            encoders._encoders.pop("test")
+
+    def test_benchmark_json_encoder(self):
+        # Smoke test: make sure the benchmark keeps working
+        res = json_encoder.run(count=10, repeat=1)
+        self.assertEqual(res["benchmark"], "json_encoder")
+        self.assertEqual(
+            res["json"]["bytes"],
+            len(encoders.dumps_json(json_encoder.make_records(10))),
+        )
@@ -4,14 +4,18 @@
 
 import json
 import textwrap
+import threading
 
 import mock
 import psycopg2
 import werkzeug
 
 from odoo import exceptions
+from odoo.tools import safe_eval
 from odoo.tools.misc import mute_logger
 
+from ..benchmarks import eval_context
+from ..etag import make_etag
 from .common import CommonEndpoint
 
 
@@ -68,6 +72,25 @@ class TestEndpoint(CommonEndpoint):
             self.env["endpoint.endpoint"]._find_endpoint("/demo/one"), self.endpoint
         )
 
+    def test_endpoint_find_by_id(self):
+        model = self.env["endpoint.endpoint"]
+        endpoint_id = self.endpoint.id
+        self.assertEqual(
+            self.endpoint._default_endpoint_options_handler()["default_pargs"],
+            ("endpoint.endpoint", "/demo/one", endpoint_id),
+        )
+        with mock.patch.object(type(model), "search", side_effect=AssertionError):
+            self.assertEqual(
+                model._find_endpoint("/demo/one", endpoint_id=endpoint_id),
+                self.endpoint,
+            )
+            # Outdated rule
+            self.assertFalse(model._find_endpoint("/demo/two", endpoint_id=endpoint_id))
+        self.endpoint.active = False
+        self.assertFalse(model._find_endpoint("/demo/one", endpoint_id=endpoint_id))
+        self.endpoint.unlink()
+        self.assertFalse(model._find_endpoint("/demo/one", endpoint_id=endpoint_id))
+
     def test_endpoint_code_eval_full_response(self):
         with self._get_mocked_request() as req:
             result = self.endpoint._handle_request(req)
@@ -93,6 +116,140 @@ class TestEndpoint(CommonEndpoint):
         payload = result["payload"]
         self.assertEqual(json.loads(payload), {"a": 1, "b": 2})
 
+    def test_endpoint_code_compiled_once(self):
+        self.endpoint.clear_caches()
+        self.endpoint.code_snippet = "result = {'payload': 1}"
+        with mock.patch.object(
+            safe_eval, "test_expr", wraps=safe_eval.test_expr
+        ) as mocked, self._get_mocked_request() as req:
+            self.assertEqual(self.endpoint._handle_request(req), {"payload": 1})
+            self.assertEqual(self.endpoint._handle_request(req), {"payload": 1})
+            self.assertEqual(mocked.call_count, 1)
+            # New snippet: compiled again
+            self.endpoint.code_snippet = "result = {'payload': 2}"
+            self.assertEqual(self.endpoint._handle_request(req), {"payload": 2})
+            self.assertEqual(mocked.call_count, 2)
+            # Changed by other means (eg: another worker): digest differs
+            self.env.cr.execute(
+                "UPDATE endpoint_endpoint SET code_snippet = %s WHERE id = %s",
+                ("result = {'payload': 3}", self.endpoint.id),
+            )
+            self.endpoint.invalidate_cache()
+            self.assertEqual(self.endpoint._handle_request(req), {"payload": 3})
+            self.assertEqual(mocked.call_count, 3)
+
+    def test_endpoint_code_eval_context(self):
+        base = self.endpoint._get_code_snippet_eval_context_base()
+        # Built once, read-only
+        self.assertIs(self.endpoint._get_code_snippet_eval_context_base(), base)
+        with self.assertRaises(TypeError):
+            base["env"] = self.env
+        with self._get_mocked_request() as req:
+            eval_ctx = self.endpoint._get_code_snippet_eval_context(req)
+        self.assertIs(eval_ctx["werkzeug"], base["werkzeug"])
+        self.assertEqual(eval_ctx["endpoint"], self.endpoint)
+        self.assertIs(eval_ctx["request"], req)
+        self.assertNotIn("endpoint", base)
+
+    def test_endpoint_code_eval_context_isolated(self):
+        base = self.endpoint._get_code_snippet_eval_context_base()
+        with self.assertRaisesRegex(AttributeError, "read-only"):
+            base["werkzeug"].exceptions.NotFound = None
+        with self.assertRaisesRegex(AttributeError, "read-only"):
+            del base["exceptions"].UserError
+        # Snippets can't change shared values, only rebind their own names
+        self.endpoint.code_snippet = textwrap.dedent(
+            """
+            werkzeug = None
+            exceptions.UserError = None
+            """
+        )
+        with self._get_mocked_request() as req:
+            with self.assertRaisesRegex(ValueError, "forbidden opcode"):
+                self.endpoint._handle_request(req)
+        self.endpoint.code_snippet = "werkzeug = None\nresult = {}"
+        endpoint2 = self.endpoint.copy({"route": "/demo/isolated"})
+        endpoint2.code_snippet = textwrap.dedent(
+            """
+            result = {
+                "payload": [werkzeug.exceptions.NotFound.code, bool(exceptions.UserError)]
+            }
+            """
+        )
+        with self._get_mocked_request() as req:
+            self.assertEqual(self.endpoint._handle_request(req), {})
+            self.assertEqual(endpoint2._handle_request(req), {"payload": [404, True]})
+
+    def test_benchmark_eval_context(self):
+        # Smoke test: make sure the benchmark keeps working
+        res = eval_context.run(self.env, count=10)
+        self.assertEqual(res["benchmark"], "eval_context")
+        self.assertGreater(res["peak_bytes_saved"], 0)
+
+    def test_endpoint_code_sandboxed(self):
+        # Same checks and errors as w/ `safe_eval`
+        self.endpoint.code_snippet = "result = {'x': ().__class__}"
+        with self._get_mocked_request() as req:
+            with self.assertRaisesRegex(NameError, "forbidden name"):
+                self.endpoint._handle_request(req)
+        self.endpoint.code_snippet = "result = {'x': len(1)}"
+        with self._get_mocked_request() as req:
+            with self.assertRaisesRegex(ValueError, "while evaluating"):
+                self.endpoint._handle_request(req)
+        self.endpoint.code_snippet = "result = {'x': 1 / 0}"
+        with self._get_mocked_request() as req:
+            with self.assertRaises(ZeroDivisionError):
+                self.endpoint._handle_request(req)
+
+    def test_endpoint_code_stream(self):
+        self.endpoint.code_snippet = "result = {'stream': lambda env: [env]}"
+        with self._get_mocked_request() as req:
+            result = self.endpoint._handle_request(req)
+        # Evaluated lazily, w/ its own cursor
+        (stream_env,) = list(result["stream"])
+        self.assertIsNot(stream_env.cr, self.env.cr)
+        self.assertEqual(stream_env.uid, self.env.uid)
+
+    def test_endpoint_code_stream_other_thread(self):
+        # Consumed by the server once the request is over
+        self.endpoint.code_snippet = "result = {'stream': lambda env: [env.uid]}"
+        with self._get_mocked_request() as req:
+            result = self.endpoint._handle_request(req)
+        res = {}
+
+        def consume():
+            try:
+                res["items"] = list(result["stream"])
+            except Exception as e:
+                res["error"] = e
+
+        thread = threading.Thread(target=consume)
+        thread.start()
+        thread.join()
+        self.assertEqual(res, {"items": [self.env.uid]})
+
+    def test_endpoint_code_etag_matches(self):
+        self.endpoint.code_snippet = textwrap.dedent(
+            """
+            result = {"etag": 1, "payload": etag_matches(1)}
+            """
+        )
+        etag = '"%s"' % make_etag(1)
+        for method, headers, expected in (
+            ("GET", [], False),
+            ("GET", [("If-None-Match", etag)], True),
+            ("GET", [("If-None-Match", 'W/"foo", ' + etag)], True),
+            ("GET", [("If-None-Match", "*")], True),
+            ("GET", [("If-None-Match", '"foo"')], False),
+            ("POST", [("If-None-Match", etag)], False),
+        ):
+            with self.subTest(method=method, headers=headers):
+                with self._get_mocked_request(
+                    httprequest={"method": method}, extra_headers=headers
+                ) as req:
+                    result = self.endpoint._handle_request(req)
+                self.assertEqual(result["payload"], expected)
+
     def test_endpoint_log(self):
         self.endpoint.write(
             {
@@ -111,6 +268,54 @@ class TestEndpoint(CommonEndpoint):
             self.endpoint._handle_request(req)
         self.env.cr.execute("DELETE FROM ir_logging")
 
+    def test_endpoint_log_buffered(self):
+        self.endpoint.code_snippet = textwrap.dedent(
+            """
+            log("one")
+            log("two", level="warning")
+            log("three")
+            result = {"ok": 1 / 0}
+            """
+        )
+        model = type(self.endpoint)
+        with mock.patch.object(
+            model, "_code_snippet_log_write"
+        ) as mocked, mock.patch.object(
+            model, "_code_snippet_log_max_entries", 2
+        ), self._get_mocked_request() as req:
+            with self.assertRaises(ZeroDivisionError):
+                self.endpoint._handle_request(req)
+        # Written at once, even if the snippet fails
+        mocked.assert_called_once_with(
+            [
+                ("info", "one"),
+                ("warning", "two"),
+                ("warning", "1 log entries dropped, max 2 per request"),
+            ]
+        )
+
+    def test_endpoint_compression_level(self):
+        self.endpoint.response_compression_level = 9
+        with self.assertRaisesRegex(exceptions.UserError, "Compression level"):
+            self.endpoint.response_compression_level = 12
+
+    def test_endpoint_log_stream(self):
+        self.endpoint.code_snippet = textwrap.dedent(
+            """
+            log("before")
+            result = {"stream": lambda env: [log("streamed"), 1][1:]}
+            """
+        )
+        with mock.patch.object(
+            type(self.endpoint), "_code_snippet_log_write"
+        ) as mocked, self._get_mocked_request() as req:
+            result = self.endpoint._handle_request(req)
+            mocked.assert_called_once_with([("info", "before")])
+            mocked.reset_mock()
+            # Entries logged while streaming are written once the stream is over
+            self.assertEqual(list(result["stream"]), [1])
+        mocked.assert_called_once_with([("info", "streamed")])
+
     @mute_logger("endpoint.endpoint", "odoo.modules.registry")
     def test_endpoint_validate_request(self):
         endpoint = self.endpoint.copy(
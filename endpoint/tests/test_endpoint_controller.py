@@ -4,11 +4,14 @@
 
 import json
 import os
+import textwrap
 from unittest import skipIf
 
 from odoo.tests.common import HttpSavepointCase
 from odoo.tools.misc import mute_logger
 
+from ..etag import make_etag
+
 
 @skipIf(os.getenv("SKIP_HTTP_CASE"), "EndpointHttpCase skipped")
 class EndpointHttpCase(HttpSavepointCase):
@@ -76,3 +79,223 @@ class EndpointHttpCase(HttpSavepointCase):
     def test_call7(self):
         response = self.url_open("/demo/bad_method", data="ok")
         self.assertEqual(response.status_code, 405)
+
+    def test_call_stream(self):
+        endpoint = self.env["endpoint.endpoint"].create(
+            {
+                "name": "Stream",
+                "route": "/demo/stream",
+                "request_method": "GET",
+                "auth_type": "public",
+                "exec_as_user_id": self.env.ref("base.user_demo").id,
+                "exec_mode": "code",
+                "code_snippet": textwrap.dedent(
+                    """
+                    rows = [[i, "item %d" % i] for i in range(3)]
+                    if request.params.get("lazy"):
+                        rows = lambda env: [[env.user.login]]
+                    result = {
+                        "stream": rows,
+                        "stream_format": request.params.get("format", "json"),
+                    }
+                    """
+                ),
+            }
+        )
+        endpoint._handle_registry_sync()
+        response = self.url_open("/demo/stream")
+        self.assertEqual(response.headers["Content-Type"], "application/json")
+        self.assertEqual(response.json(), [[0, "item 0"], [1, "item 1"], [2, "item 2"]])
+        response = self.url_open("/demo/stream?format=ndjson")
+        self.assertEqual(response.headers["Content-Type"], "application/x-ndjson")
+        self.assertEqual(
+            response.content, b'[0,"item 0"]\n[1,"item 1"]\n[2,"item 2"]\n'
+        )
+        response = self.url_open("/demo/stream?format=csv")
+        self.assertEqual(response.headers["Content-Type"], "text/csv")
+        self.assertEqual(response.content, b"0,item 0\r\n1,item 1\r\n2,item 2\r\n")
+        # Read while streaming
+        response = self.url_open("/demo/stream?format=ndjson&lazy=1")
+        self.assertEqual(response.content, b'["demo"]\n')
+
+    def test_call_etag_digest(self):
+        response = self.url_open("/demo/json_data")
+        etag = response.headers["ETag"]
+        self.assertEqual(etag, '"%s"' % make_etag(response.content))
+        response = self.url_open("/demo/json_data", headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b"")
+        self.assertEqual(response.headers["ETag"], etag)
+        response = self.url_open(
+            "/demo/json_data", headers={"If-None-Match": '"outdated"'}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {"a": 1, "b": 2})
+
+    def test_call_etag_validator(self):
+        endpoint = self.env["endpoint.endpoint"].create(
+            {
+                "name": "ETag",
+                "route": "/demo/etag",
+                "request_method": "GET",
+                "auth_type": "public",
+                "exec_as_user_id": self.env.ref("base.user_demo").id,
+                "exec_mode": "code",
+                "code_snippet": textwrap.dedent(
+                    """
+                    validator = request.params.get("version")
+                    result = {"etag": validator}
+                    if not etag_matches(validator):
+                        result["payload"] = {"version": validator}
+                    log("computed" if "payload" in result else "skipped")
+                    """
+                ),
+            }
+        )
+        endpoint._handle_registry_sync()
+        etag = '"%s"' % make_etag("1")
+        response = self.url_open("/demo/etag?version=1")
+        self.assertEqual(response.headers["ETag"], etag)
+        self.assertEqual(response.json(), {"version": "1"})
+        response = self.url_open(
+            "/demo/etag?version=1", headers={"If-None-Match": etag}
+        )
+        self.assertEqual(response.status_code, 304)
+        response = self.url_open(
+            "/demo/etag?version=2", headers={"If-None-Match": etag}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {"version": "2"})
+        self.env.cr.execute(
+            "SELECT message FROM ir_logging WHERE func = %s ORDER BY id",
+            (endpoint.name,),
+        )
+        self.assertEqual(
+            [row[0] for row in self.env.cr.fetchall()],
+            ["computed", "skipped", "computed"],
+        )
+
+    def test_call_compression(self):
+        endpoint = self.env.ref("endpoint.endpoint_demo_3")
+        gzip = {"Accept-Encoding": "gzip"}
+        response = self.url_open("/demo/json_data", headers=gzip)
+        self.assertNotIn("Content-Encoding", response.headers)
+        endpoint.write(
+            {"response_compression": True, "response_compression_min_size": 0}
+        )
+        response = self.url_open("/demo/json_data", headers=gzip)
+        self.assertEqual(response.headers["Content-Encoding"], "gzip")
+        self.assertIn("Accept-Encoding", response.headers["Vary"])
+        self.assertTrue(response.headers["ETag"].startswith("W/"))
+        # Decoded by `requests`
+        self.assertEqual(response.json(), {"a": 1, "b": 2})
+        # Conditional requests still work
+        response = self.url_open(
+            "/demo/json_data",
+            headers=dict(gzip, **{"If-None-Match": response.headers["ETag"]}),
+        )
+        self.assertEqual(response.status_code, 304)
+        # Not accepted
+        response = self.url_open(
+            "/demo/json_data", headers={"Accept-Encoding": "identity"}
+        )
+        self.assertNotIn("Content-Encoding", response.headers)
+        self.assertEqual(response.json(), {"a": 1, "b": 2})
+        # Too small
+        endpoint.response_compression_min_size = 100
+        response = self.url_open("/demo/json_data", headers=gzip)
+        self.assertNotIn("Content-Encoding", response.headers)
+
+    def test_call_compression_stream(self):
+        endpoint = self.env["endpoint.endpoint"].create(
+            {
+                "name": "Stream",
+                "route": "/demo/stream",
+                "request_method": "GET",
+                "auth_type": "public",
+                "exec_as_user_id": self.env.ref("base.user_demo").id,
+                "exec_mode": "code",
+                "code_snippet": textwrap.dedent(
+                    """
+                    count = int(request.params.get("count"))
+                    result = {
+                        "stream": [{"id": i, "name": "Item"} for i in range(count)],
+                        "stream_format": "ndjson",
+                    }
+                    """
+                ),
+                "response_compression": True,
+                "response_compression_min_size": 1024,
+            }
+        )
+        endpoint._handle_registry_sync()
+        gzip = {"Accept-Encoding": "gzip"}
+        response = self.url_open("/demo/stream?count=2", headers=gzip)
+        self.assertNotIn("Content-Encoding", response.headers)
+        self.assertEqual(len(response.content.splitlines()), 2)
+        # Several chunks
+        response = self.url_open("/demo/stream?count=10000", headers=gzip)
+        self.assertEqual(response.headers["Content-Encoding"], "gzip")
+        lines = response.content.splitlines()
+        self.assertEqual(len(lines), 10000)
+        self.assertEqual(json.loads(lines[-1]), {"id": 9999, "name": "Item"})
+
+    def test_call_deferred(self):
+        endpoint = self.env["endpoint.endpoint"].create(
+            {
+                "name": "Deferred",
+                "route": "/demo/deferred",
+                "request_method": "GET",
+                "auth_type": "public",
+                "exec_as_user_id": self.env.ref("base.user_demo").id,
+                "exec_mode": "deferred",
+                "code_snippet": textwrap.dedent(
+                    """
+                    name = request.params.get("name")
+                    result = {"payload": {"hello": name, "user": user.login}}
+                    """
+                ),
+            }
+        )
+        endpoint._handle_registry_sync()
+        response = self.url_open("/demo/deferred?name=John")
+        self.assertEqual(response.status_code, 202)
+        data = response.json()
+        self.assertEqual(data["state"], "pending")
+        self.assertEqual(response.headers["Location"], data["url"])
+        response = self.url_open(data["url"])
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.json(), {"job": data["job"], "state": "pending"})
+        self.env["endpoint.job"]._cron_run()
+        response = self.url_open(data["url"])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {"hello": "John", "user": "demo"})
+        response = self.url_open("/endpoint/job/unknown")
+        self.assertEqual(response.status_code, 404)
+
+    def test_call_deferred_user(self):
+        endpoint = self.env["endpoint.endpoint"].create(
+            {
+                "name": "Deferred user",
+                "route": "/demo/deferred/user",
+                "request_method": "GET",
+                "auth_type": "user_endpoint",
+                "exec_mode": "deferred",
+                "code_snippet": "result = {'payload': {'user': user.login}}",
+            }
+        )
+        endpoint._handle_registry_sync()
+        self.authenticate("admin", "admin")
+        response = self.url_open("/demo/deferred/user")
+        self.assertEqual(response.status_code, 202)
+        url = response.json()["url"]
+        self.env["endpoint.job"]._cron_run()
+        # Only the requester gets the result
+        self.authenticate(None, None)
+        self.assertEqual(self.url_open(url).status_code, 401)
+        self.authenticate("demo", "demo")
+        self.assertEqual(self.url_open(url).status_code, 404)
+        self.authenticate("admin", "admin")
+        response = self.url_open(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {"user": "admin"})
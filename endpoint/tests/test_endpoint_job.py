@@ -0,0 +1,145 @@
+# Copyright 2026 Camptocamp SA
+# License LGPL-3.0 or later (http://www.gnu.org/licenses/lgpl).
+
+import base64
+import json
+import textwrap
+
+import mock
+
+from odoo import exceptions
+from odoo.tools.misc import mute_logger
+
+from .common import CommonEndpoint
+
+
+class TestEndpointJob(CommonEndpoint):
+    @classmethod
+    def _setup_records(cls):
+        super()._setup_records()
+        cls.endpoint = cls.env["endpoint.endpoint"].create(
+            {
+                "name": "Deferred",
+                "route": "/demo/deferred",
+                "request_method": "POST",
+                "request_content_type": "application/json",
+                "auth_type": "user_endpoint",
+                "exec_mode": "deferred",
+                "code_snippet": textwrap.dedent(
+                    """
+                    data = json.loads(request.httprequest.data)
+                    total = data["a"] + int(request.params["b"])
+                    result = {"payload": {"total": total}, "status_code": 201}
+                    """
+                ),
+            }
+        )
+        cls.cron = cls.env.ref("endpoint.cron_endpoint_job_run")
+
+    def _enqueue(self, endpoint=None):
+        endpoint = endpoint or self.endpoint
+        with mock.patch.object(
+            type(self.cron), "_trigger"
+        ) as mocked, self._get_mocked_request(
+            httprequest={
+                "method": "POST",
+                "path": endpoint.route,
+                "content_type": "application/json",
+                "get_data": lambda: b'{"a": 1}',
+            },
+            request_attrs={"params": {"b": "2", "file": object()}},
+        ) as req:
+            result = endpoint._handle_request(req)
+            mocked.assert_called_once()
+        job = self.env["endpoint.job"].search(
+            [("token", "=", result["payload"]["job"])]
+        )
+        return job, result
+
+    def test_validation(self):
+        with self.assertRaisesRegex(
+            exceptions.UserError, r"you must provide a piece of code"
+        ):
+            self.endpoint.copy({"route": "/demo/deferred/2", "code_snippet": False})
+
+    def test_enqueue(self):
+        job, result = self._enqueue()
+        url = "/endpoint/job/%s" % job.token
+        self.assertEqual(
+            result,
+            {
+                "status_code": 202,
+                "payload": {"job": job.token, "state": "pending", "url": url},
+                "headers": {"Location": url},
+            },
+        )
+        self.assertEqual(job._get_endpoint(), self.endpoint)
+        self.assertEqual(job.user_id, self.env.user)
+        self.assertEqual(job.request_method, "POST")
+        self.assertEqual(job.request_path, "/demo/deferred")
+        # Only string params are kept
+        self.assertEqual(json.loads(job.request_params), {"b": "2"})
+        self.assertEqual(base64.b64decode(job.request_body), b'{"a": 1}')
+
+    def test_run(self):
+        job, __ = self._enqueue()
+        job._run()
+        self.assertEqual(job.state, "done")
+        self.assertTrue(job.date_done)
+        self.assertEqual(job.result_status, 201)
+        self.assertEqual(
+            json.loads(job.result_headers), {"Content-Type": "application/json"}
+        )
+        self.assertEqual(json.loads(base64.b64decode(job.result_body)), {"total": 3})
+
+    @mute_logger("odoo.addons.endpoint.models.endpoint_job", "endpoint.endpoint")
+    def test_run_failed(self):
+        job, __ = self._enqueue()
+        self.endpoint.code_snippet = "raise exceptions.UserError('Nope')"
+        job._run()
+        self.assertEqual(job.state, "failed")
+        self.assertEqual(job.result_status, 400)
+        self.assertIn("Bad Request", job.error)
+        job, __ = self._enqueue()
+        self.endpoint.code_snippet = "result = {'total': 1 / 0}"
+        job._run()
+        self.assertEqual(job.state, "failed")
+        self.assertEqual(job.result_status, 500)
+        job, __ = self._enqueue()
+        self.endpoint.code_snippet = "result = {'stream': [1]}"
+        job._run()
+        self.assertEqual(job.state, "failed")
+        self.assertIn("Streams are not supported", job.error)
+
+    def test_cron_run(self):
+        jobs = self._enqueue()[0] | self._enqueue()[0]
+        with mock.patch.object(type(self.cron), "_trigger"):
+            self.env["endpoint.job"]._cron_run()
+        self.assertEqual(jobs.mapped("state"), ["done", "done"])
+
+    @mute_logger("odoo.addons.endpoint.models.endpoint_job")
+    def test_cron_run_stale(self):
+        stale = self._enqueue()[0]
+        running = self._enqueue()[0]
+        (stale | running).write({"state": "running"})
+        self.env.cr.execute(
+            "UPDATE endpoint_job SET write_date = '2000-01-01' WHERE id = %s",
+            (stale.id,),
+        )
+        stale.invalidate_cache()
+        with mock.patch.object(type(self.cron), "_trigger"):
+            self.env["endpoint.job"]._cron_run()
+        self.assertEqual(stale.state, "failed")
+        self.assertEqual(stale.error, "Job interrupted")
+        self.assertTrue(stale.date_done)
+        self.assertEqual(running.state, "running")
+
+    def test_gc(self):
+        job, __ = self._enqueue()
+        job._run()
+        model = self.env["endpoint.job"]
+        model._gc_jobs()
+        self.assertTrue(job.exists())
+        job.date_done = "2000-01-01"
+        model._gc_jobs()
+        self.assertFalse(job.exists())
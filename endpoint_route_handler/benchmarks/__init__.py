@@ -0,0 +1,16 @@
+# Copyright 2026 Camptocamp SA
+# License LGPL-3.0 or later (http://www.gnu.org/licenses/lgpl).
+"""Benchmarks for the endpoint registry.
+
+They are not loaded w/ the module nor run w/ the tests.
+Run them from an Odoo shell, eg::
+
+    from odoo.addons.endpoint_route_handler.benchmarks import rule_memory
+    rule_memory.main()
+
+    from odoo.addons.endpoint_route_handler.benchmarks import registry_scale
+    registry_scale.main(env, output="/tmp/endpoint_route_bench.json")
+
+Results are printed (or written to `output`) as JSON
+to be compared among runs.
+"""
@@ -0,0 +1,195 @@
+# Copyright 2026 Camptocamp SA
+# License LGPL-3.0 or later (http://www.gnu.org/licenses/lgpl).
+"""Time registry operations and routing map build at several registry sizes.
+
+Rules are seeded in `endpoint_route` within a savepoint
+which is rolled back after each size: no rule is left on the DB.
+The `endpoint_route_version` sequence is not transactional though:
+it keeps the versions consumed by the benchmark.
+It is not set back on purpose as processes might have seen them already,
+they would ignore the next changes until the version goes past them.
+Hence running processes refresh their routing maps once, as on any change.
+Routing maps of the current process are reset while timing their build,
+current ones are given back once done.
+Server config flags (`endpoint_route_*`) apply as usual,
+run the benchmark w/ different flags to compare them.
+
+Results are returned (and printed by `main`) as JSON, eg::
+
+    {
+        "benchmark": "registry_scale",
+        "results": [
+            {"size": 1000, "update_rules_create": 0.12, ...},
+            ...
+        ]
+    }
+
+Timings are in seconds.
+"""
+
+import json
+import sys
+import time
+import uuid
+from contextlib import contextmanager
+from types import SimpleNamespace
+
+from odoo import http
+
+from ..registry import EndpointRegistry
+
+SIZES = (1000, 10000, 100000)
+# Calls to average for fast operations
+REPEAT = 100
+
+HANDLER = {
+    "klass_dotted_path": "odoo.addons.endpoint_route_handler.controllers.main."
+    "EndpointNotFoundController",
+    "method_name": "auto_not_found",
+}
+
+
+def timed(func, *args, repeat=1, **kw):
+    """Return the average time spent by `repeat` calls to `func`."""
+    start = time.perf_counter()
+    for __ in range(repeat):
+        func(*args, **kw)
+    return round((time.perf_counter() - start) / repeat, 6)
+
+
+def make_rules(e_registry, count, version=1):
+    rules = []
+    for i in range(count):
+        route = "/bench/{}/route_{}/v{}".format(i % 100, i, version)
+        routing = {
+            "type": "http",
+            "auth": "user_endpoint",
+            "methods": ["GET"],
+            "routes": [route],
+            "csrf": False,
+        }
+        handler = dict(HANDLER, default_kwargs={"endpoint_route": route})
+        rules.append(
+            e_registry.make_rule(
+                "bench_{}".format(i),
+                route,
+                {"handler": handler},
+                routing,
+                "bench_{}_{}".format(i, version),
+                route_group="bench_{}".format(i % 100),
+            )
+        )
+    return rules
+
+
+# Attributes of `ir.http` holding the routing maps of the process
+ROUTING_MAP_ATTRS = (
+    "_routing_map",
+    "_rewrite_len",
+    "_endpoint_route_last_version",
+    "_endpoint_route_dispatcher",
+    "_endpoint_route_loaded_prefixes",
+    "_endpoint_route_known_prefixes",
+)
+
+
+def consume(iterable):
+    for __ in iterable:
+        pass
+
+
+@contextmanager
+def mock_request(env, method="GET"):
+    """Push the bare minimum of a request needed by `ir.http` routing maps."""
+    request = SimpleNamespace(
+        env=env,
+        registry=env.registry,
+        httprequest=SimpleNamespace(method=method, path="/"),
+    )
+    http._request_stack.push(request)
+    try:
+        yield request
+    finally:
+        http._request_stack.pop()
+
+
+@contextmanager
+def routing_maps_restored(env):
+    """Give back current routing maps of the process on exit."""
+    ir_http_cls = type(env["ir.http"])
+    saved = {
+        name: value
+        for name, value in vars(ir_http_cls).items()
+        if name in ROUTING_MAP_ATTRS
+    }
+    try:
+        yield
+    finally:
+        for name in ROUTING_MAP_ATTRS:
+            if name in saved:
+                setattr(ir_http_cls, name, saved[name])
+            elif name in vars(ir_http_cls):
+                delattr(ir_http_cls, name)
+
+
+def bench_size(env, size):
+    e_registry = EndpointRegistry.registry_for(env.cr)
+    ir_http = env["ir.http"]
+    res = {"size": size}
+    rules = make_rules(e_registry, size)
+    res["update_rules_create"] = timed(e_registry.update_rules, rules)
+    # Half of the rules change
+    rules[::2] = make_rules(e_registry, size, version=2)[::2]
+    res["update_rules_update"] = timed(e_registry.update_rules, rules)
+    res["update_rules_unchanged"] = timed(e_registry.update_rules, rules)
+    res["get_rules"] = timed(lambda: consume(e_registry.get_rules()))
+    res["get_rules_stream"] = timed(lambda: consume(e_registry.get_rules(stream=True)))
+    res["last_version"] = timed(e_registry.last_version, repeat=REPEAT)
+    path = rules[-1].route
+
+    def match():
+        # Same as `ir.http._match`, w/o relying on the website's key
+        return ir_http._endpoint_route_match(
+            path,
+            lambda: ir_http.routing_map()
+            .bind("localhost")
+            .match(path, return_rule=True),
+        )
+
+    with mock_request(env):
+        ir_http._clear_routing_map()
+        res["endpoint_routing_rules"] = timed(
+            lambda: consume(ir_http._endpoint_routing_rules())
+        )
+        # 1st request: build the map and match a route (compiles the map)
+        ir_http._clear_routing_map()
+        res["routing_map_first_request"] = timed(match)
+        res["routing_map_match"] = timed(match, repeat=REPEAT)
+        ir_http._clear_routing_map()
+    res["drop_rules"] = timed(e_registry.drop_rules, [rule.key for rule in rules])
+    return res
+
+
+def run(env, sizes=SIZES):
+    results = []
+    with routing_maps_restored(env):
+        for size in sizes:
+            savepoint = "endpoint_route_bench_{}".format(uuid.uuid4().hex)
+            env.cr.execute("SAVEPOINT {}".format(savepoint))
+            try:
+                results.append(bench_size(env, size))
+            finally:
+                env.cr.execute("ROLLBACK TO SAVEPOINT {}".format(savepoint))
+    return {"benchmark": "registry_scale", "results": results}
+
+
+def main(env, sizes=SIZES, output=None):
+    """Run the benchmark and write results as JSON to `output` (default: stdout)."""
+    res = run(env, sizes=sizes)
+    if output:
+        with open(output, "w") as fd:
+            json.dump(res, fd, indent=2)
+    else:
+        json.dump(res, sys.stdout, indent=2)
+        sys.stdout.write("\n")
+    return res
@@ -0,0 +1,122 @@
+# Copyright 2026 Camptocamp SA
+# License LGPL-3.0 or later (http://www.gnu.org/licenses/lgpl).
+"""Compare memory and build time of plain vs interned `EndpointRule`.
+
+Plain rules hold their own decoded `opts` and `routing`
+as they come from the DB, interned ones are built via `EndpointRule.from_row`.
+"""
+
+import gc
+import json
+import sys
+import time
+import tracemalloc
+
+from ..registry import EndpointRule
+
+HANDLERS = [
+    {
+        "klass_dotted_path": "odoo.addons.endpoint.controllers.main.EndpointController",
+        "method_name": "auto_endpoint",
+    },
+    {
+        "klass_dotted_path": "odoo.addons.endpoint_route_handler.controllers.main."
+        "EndpointNotFoundController",
+        "method_name": "auto_not_found",
+    },
+]
+
+
+def make_rows(count):
+    """Return `count` rows as stored in `endpoint_route`, w/ json columns."""
+    rows = []
+    for i in range(count):
+        route = "/bench/{}/route_{}".format(i % 10, i)
+        handler = dict(HANDLERS[i % len(HANDLERS)])
+        # Per rule arguments, as passed by `endpoint.endpoint`
+        handler["default_pargs"] = ["endpoint.endpoint", route, i]
+        routing = {
+            "type": "http",
+            "auth": "user_endpoint",
+            "methods": ["GET"],
+            "routes": [route],
+            "csrf": False,
+        }
+        rows.append(
+            (
+                i,
+                "bench_{}".format(i),
+                route,
+                json.dumps({"handler": handler}),
+                json.dumps(routing),
+                "hash_{}".format(i),
+                "bench_group_{}".format(i % 10),
+                None,
+            )
+        )
+    return rows
+
+
+def make_plain_rule(dbname, row):
+    key, route, options, routing, endpoint_hash, route_group = row[1:-1]
+    return EndpointRule(
+        dbname,
+        key,
+        route,
+        json.loads(options),
+        json.loads(routing),
+        endpoint_hash,
+        route_group,
+    )
+
+
+def access_options(rule):
+    """Read handler options as `EndpointRule.endpoint` does."""
+    handler_options = rule.handler_options
+    return (
+        handler_options.klass_dotted_path,
+        handler_options.method_name,
+        handler_options.get("default_pargs", ()),
+    )
+
+
+def measure(factory, rows, dbname="bench"):
+    """Build rules from rows and return memory and timing figures.
+
+    Memory is measured once options have been accessed,
+    hence anything built on access is accounted for.
+    """
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    rules = [factory(dbname, row) for row in rows]
+    build_time = time.perf_counter() - start
+    start = time.perf_counter()
+    for rule in rules:
+        access_options(rule)
+    options_time = time.perf_counter() - start
+    memory, __ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "memory_bytes": memory,
+        "build_seconds": round(build_time, 4),
+        "options_seconds": round(options_time, 4),
+    }
+
+
+def run(count=50000):
+    rows = make_rows(count)
+    plain = measure(make_plain_rule, rows)
+    interned = measure(EndpointRule.from_row, rows)
+    return {
+        "benchmark": "rule_memory",
+        "count": count,
+        "plain": plain,
+        "interned": interned,
+        "memory_ratio": round(interned["memory_bytes"] / plain["memory_bytes"], 3),
+    }
+
+
+def main(count=50000):
+    json.dump(run(count=count), sys.stdout, indent=2)
+    sys.stdout.write("\n")
@@ -0,0 +1,91 @@
+# Copyright 2026 Camptocamp SA
+# License LGPL-3.0 or later (http://www.gnu.org/licenses/lgpl).
+
+import werkzeug
+
+
+class EndpointRouteDispatcher:
+    """Lookup table for static endpoint routes.
+
+    Routes w/o placeholders are matched via a plain dictionary lookup
+    on exact path and method, hence the cost does not grow w/ the number of routes.
+    Routes w/ placeholders must go through werkzeug's routing map.
+
+    Werkzeug rules are bound to a private map (w/o being added to it)
+    to be able to build URLs from them as usual.
+
+    Trailing slashes are handled as by werkzeug w/ `strict_slashes=False`:
+    a route ending w/ a slash matches the path w/o it as well,
+    the other way around is not true.
+    Routes w/ `strict_slashes` (redirecting to the path w/ a slash)
+    must go through werkzeug's routing map.
+    """
+
+    def __init__(self, converters=None):
+        self._map = werkzeug.routing.Map(strict_slashes=False, converters=converters)
+        # path -> {method: werkzeug rule}
+        self._routes = {}
+        # path w/o trailing slash -> {method: werkzeug rule}
+        self._slashless_routes = {}
+        # endpoint rule key -> [(routes, path, methods)]
+        self._keys = {}
+        # endpoint rule key -> route group
+        self._groups = {}
+
+    def __len__(self):
+        return len(self._routes)
+
+    @staticmethod
+    def is_static(url):
+        return "<" not in url
+
+    def add(self, key, group, wz_rule):
+        """Register a werkzeug rule for given endpoint rule key."""
+        wz_rule.bind(self._map)
+        methods = wz_rule.methods or (None,)
+        paths = [(self._routes, wz_rule.rule)]
+        if wz_rule.rule != "/" and wz_rule.rule.endswith("/"):
+            paths.append((self._slashless_routes, wz_rule.rule.rstrip("/")))
+        for routes, path in paths:
+            # Replace the dict rather than altering it
+            # as it might be read by a concurrent match.
+            by_method = dict(routes.get(path, {}))
+            by_method.update({method: wz_rule for method in methods})
+            routes[path] = by_method
+            self._keys.setdefault(key, []).append((routes, path, methods))
+        self._groups[key] = group or ""
+
+    def discard(self, key):
+        """Drop all the rules of given endpoint rule key."""
+        self._groups.pop(key, None)
+        for routes, path, methods in self._keys.pop(key, ()):
+            by_method = {
+                method: wz_rule
+                for method, wz_rule in routes.get(path, {}).items()
+                if method not in methods
+            }
+            if by_method:
+                routes[path] = by_method
+            else:
+                routes.pop(path, None)
+
+    def keys(self, groups=None):
+        return {
+            key
+            for key, group in self._groups.items()
+            if groups is None or group in groups
+        }
+
+    def match(self, path, method):
+        """Return `(rule, arguments)` for given path and method or None.
+
+        A known path w/ another method is not matched either:
+        other rules in the routing map might handle it,
+        and the routing map answers w/ 405 otherwise.
+        """
+        for routes in (self._routes, self._slashless_routes):
+            by_method = routes.get(path) or {}
+            wz_rule = by_method.get(method) or by_method.get(None)
+            if wz_rule is not None:
+                return wz_rule, dict(wz_rule.defaults or {})
+        return None
@@ -0,0 +1,131 @@
+# Copyright 2026 Camptocamp SA
+# License LGPL-3.0 or later (http://www.gnu.org/licenses/lgpl).
+
+import logging
+import os
+import select
+import threading
+
+import psycopg2
+from psycopg2 import sql
+from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
+
+from odoo import sql_db
+
+_logger = logging.getLogger(__name__)
+
+CHANNEL = "endpoint_route_version"
+
+
+class EndpointRouteVersionListener:
+    """Track the version of the endpoint registry via LISTEN/NOTIFY.
+
+    Registry triggers send a notification on `CHANNEL`
+    every time routes change (see `EndpointRegistry._setup_db_version`).
+
+    The listener keeps one connection per database listening on it
+    and a daemon thread updates the last known version in memory.
+    Hence, reading the version does not require any DB round trip.
+    """
+
+    # Max seconds before a newly listened db is picked up by the thread
+    _select_timeout = 1.0
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._connections = {}
+        self._versions = {}
+        self._thread = None
+
+    def get_version(self, dbname):
+        """Return the last known version for given db.
+
+        Start listening on the db on 1st call.
+        Return None if the version cannot be tracked.
+        """
+        if self._pid != os.getpid():
+            # Forked process: connections and thread belong to the parent
+            with self._lock:
+                self._reset()
+        if dbname not in self._connections:
+            self._listen(dbname)
+        return self._versions.get(dbname)
+
+    def _connect(self, dbname):
+        __, connection_info = sql_db.connection_info_for(dbname)
+        conn = psycopg2.connect(**connection_info)
+        conn.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+        return conn
+
+    def _listen(self, dbname):
+        with self._lock:
+            if dbname in self._connections:
+                return
+            try:
+                conn = self._connect(dbname)
+                with conn.cursor() as cr:
+                    # Listen 1st to not miss any change happening in between
+                    cr.execute(sql.SQL("LISTEN {}").format(sql.Identifier(CHANNEL)))
+                    cr.execute("SELECT last_value FROM endpoint_route_version")
+                    self._versions[dbname] = cr.fetchone()[0]
+            except psycopg2.Error:
+                _logger.exception("Cannot listen to %s on db %s", CHANNEL, dbname)
+                # Do not try again, version will be read from the db
+                self._connections[dbname] = None
+                return
+            self._connections[dbname] = conn
+            _logger.info("Listening to %s on db %s", CHANNEL, dbname)
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="endpoint_route_version_listener"
+                )
+                self._thread.daemon = True
+                self._thread.start()
+
+    def _forget(self, dbname):
+        with self._lock:
+            conn = self._connections.pop(dbname, None)
+            self._versions.pop(dbname, None)
+        if conn is not None:
+            try:
+                conn.close()
+            except psycopg2.Error:
+                pass
+
+    def _set_version(self, dbname, version):
+        if version > self._versions.get(dbname, 0):
+            self._versions[dbname] = version
+
+    def _run(self):
+        while True:
+            with self._lock:
+                conns = {
+                    conn: dbname
+                    for dbname, conn in self._connections.items()
+                    if conn is not None
+                }
+            ready, __, __ = select.select(list(conns), [], [], self._select_timeout)
+            for conn in ready:
+                self._process(conns[conn], conn)
+
+    def _process(self, dbname, conn):
+        try:
+            conn.poll()
+        except psycopg2.Error:
+            # Forget it: next call to `get_version` will listen again
+            _logger.warning("Lost %s listener connection on db %s", CHANNEL, dbname)
+            self._forget(dbname)
+            return
+        while conn.notifies:
+            notify = conn.notifies.pop(0)
+            try:
+                self._set_version(dbname, int(notify.payload))
+            except ValueError:
+                _logger.warning("Invalid %s payload: %s", CHANNEL, notify.payload)
+
+
+version_listener = EndpointRouteVersionListener()
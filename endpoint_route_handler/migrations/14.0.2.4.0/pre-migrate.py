@@ -0,0 +1,22 @@
+# Copyright 2026 Camptocamp SA (http://www.camptocamp.com)
+# License LGPL-3.0 or later (http://www.gnu.org/licenses/lgpl).
+
+import logging
+
+# fmt: off
+from odoo.addons.endpoint_route_handler.registry import (
+    EndpointRegistry,  # pylint: disable=odoo-addons-relative-import
+)
+
+# fmt: on
+
+_logger = logging.getLogger(__name__)
+
+
+def migrate(cr, version):
+    if not version:
+        return
+
+    EndpointRegistry._setup_db_json_columns(cr)
+    EndpointRegistry._setup_db_routing_index(cr)
+    _logger.info("endpoint_route json columns converted to jsonb")
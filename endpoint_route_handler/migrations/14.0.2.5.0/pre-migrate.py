@@ -0,0 +1,22 @@
+# Copyright 2026 Camptocamp SA (http://www.camptocamp.com)
+# License LGPL-3.0 or later (http://www.gnu.org/licenses/lgpl).
+
+import logging
+
+# fmt: off
+from odoo.addons.endpoint_route_handler.registry import (
+    EndpointRegistry,  # pylint: disable=odoo-addons-relative-import
+)
+
+# fmt: on
+
+_logger = logging.getLogger(__name__)
+
+
+def migrate(cr, version):
+    if not version:
+        return
+
+    # Switch to statement level version bumps and track group versions
+    EndpointRegistry._setup_db_version(cr)
+    _logger.info("endpoint_route version triggers updated")
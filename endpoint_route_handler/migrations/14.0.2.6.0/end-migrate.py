@@ -0,0 +1,44 @@
+# Copyright 2026 Camptocamp SA (http://www.camptocamp.com)
+# License LGPL-3.0 or later (http://www.gnu.org/licenses/lgpl).
+
+import logging
+
+from odoo import SUPERUSER_ID, api
+
+# fmt: off
+from odoo.addons.endpoint_route_handler.registry import (  # pylint: disable=odoo-addons-relative-import
+    EndpointRegistry,
+    query_multi_update,
+)
+
+# fmt: on
+
+_logger = logging.getLogger(__name__)
+
+
+def migrate(cr, version):
+    if not version:
+        return
+
+    # `endpoint_hash` used to rely on python's `hash` which is not stable:
+    # rehash registered rules w/ the new stable digest.
+    # This runs at the end of the upgrade to have all consumer models loaded.
+    env = api.Environment(cr, SUPERUSER_ID, {})
+    for model in env["endpoint.route.handler"]._get_endpoint_route_consumer_models():
+        rows = [
+            {
+                "key": rec._endpoint_registry_unique_key(),
+                "endpoint_hash": rec.endpoint_hash,
+            }
+            for rec in env[model].search([])
+        ]
+        if not rows:
+            continue
+        query_multi_update(
+            cr,
+            EndpointRegistry._table,
+            rows,
+            ["key", "endpoint_hash"],
+            col_types=EndpointRegistry._col_types(),
+        )
+        _logger.info("endpoint_hash updated for %s rules of %s", len(rows), model)
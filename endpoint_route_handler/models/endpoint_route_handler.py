@@ -2,6 +2,8 @@
 # @author: Simone Orsi <simone.orsi@camptocamp.com>
 # License LGPL-3.0 or later (http://www.gnu.org/licenses/lgpl).
 
+import hashlib
+import json
 import logging
 
 from odoo import _, api, exceptions, fields, models
@@ -143,7 +145,24 @@ class EndpointRouteHandler(models.AbstractModel):
         ]
         for rec, vals in zip(self, values):
             vals.pop("id", None)
-            rec.endpoint_hash = hash(tuple(vals.values()))
+            rec.endpoint_hash = rec._make_endpoint_hash(vals)
+
+    def _make_endpoint_hash(self, values):
+        """Return a stable digest of given values.
+
+        Unlike python's `hash`, the result is the same across processes
+        (see PYTHONHASHSEED) hence it can be used to detect changes.
+        """
+        data = json.dumps(
+            values, sort_keys=True, default=self._endpoint_hash_json_default
+        )
+        # 16 bytes -> 32 chars, see `EndpointRegistry._columns`
+        return hashlib.blake2b(data.encode(), digest_size=16).hexdigest()
+
+    def _endpoint_hash_json_default(self, value):
+        if isinstance(value, models.BaseModel):
+            return value.ids
+        return str(value)
 
     def _routing_impacting_fields(self):
         return ("route", "auth_type", "request_method")
@@ -88,11 +88,13 @@ class EndpointRouteSyncMixin(models.AbstractModel):
         if not self:
             return
         rules = self._prepare_endpoint_rules(options=options)
-        self._endpoint_registry.update_rules(rules, init=init)
+        created, updated = self._endpoint_registry.upsert_rules(rules)
         _logger.debug(
-            "%s registered controllers: %s",
+            "%s registered controllers: %s (created: %s, updated: %s)",
             self._name,
             ", ".join([r.route for r in rules]),
+            len(created),
+            len(updated),
         )
 
     def _unregister_controllers(self):
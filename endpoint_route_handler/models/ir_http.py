@@ -3,16 +3,30 @@
 # License LGPL-3.0 or later (http://www.gnu.org/licenses/lgpl).
 
 import logging
+import threading
+from contextlib import contextmanager
 from itertools import chain
 
 import werkzeug
 
-from odoo import http, models, registry as registry_get
+from odoo import http, models, registry as registry_get, tools
 
-from ..registry import EndpointRegistry
+from ..dispatcher import EndpointRouteDispatcher
+from ..listener import version_listener
+from ..registry import (
+    EndpointRegistry,
+    resolve_handler,
+    route_prefix,
+    route_prefix_is_dynamic,
+)
 
 _logger = logging.getLogger(__name__)
 
+# Serialize in place updates of routing maps among threads
+_routing_map_lock = threading.RLock()
+# Per thread flag to skip version checks once already done for current match
+_local = threading.local()
+
 
 class IrHttp(models.AbstractModel):
     _inherit = "ir.http"
@@ -33,14 +47,108 @@ class IrHttp(models.AbstractModel):
     def _endpoint_routing_rules(cls):
         """Yield custom endpoint rules"""
         e_registry = cls._endpoint_route_registry(http.request.env.cr)
-        for endpoint_rule in e_registry.get_rules():
+        use_dispatcher = cls._endpoint_route_config_flag("dispatcher")
+        for endpoint_rule in cls._endpoint_route_rules_to_load(e_registry):
             _logger.debug("LOADING %s", endpoint_rule)
-            endpoint = endpoint_rule.endpoint
-            for url in endpoint_rule.routing["routes"]:
-                yield (url, endpoint, endpoint_rule.routing)
+            for url, endpoint, routing in cls._endpoint_rule_routing_rules(
+                endpoint_rule
+            ):
+                if use_dispatcher and cls._endpoint_route_dispatchable(url, routing):
+                    # Served by the dispatcher
+                    continue
+                yield (url, endpoint, routing)
+        _logger.debug("Endpoint handlers resolution: %s", resolve_handler.cache_info())
+
+    @classmethod
+    def _endpoint_route_rules_to_load(cls, e_registry):
+        """Yield the rules to load in the routing map and the dispatcher."""
+        if not cls._endpoint_route_config_flag("lazy"):
+            return e_registry.get_rules(stream=True)
+        prefixes = set(getattr(cls, "_endpoint_route_loaded_prefixes", None) or ())
+        # Routes starting w/ a converter can't be looked up by prefix
+        prefixes.update(
+            prefix
+            for prefix in e_registry.get_route_prefixes()
+            if route_prefix_is_dynamic(prefix)
+        )
+        if not prefixes:
+            return iter(())
+        return e_registry.get_rules(stream=True, prefixes=prefixes)
+
+    @classmethod
+    def _endpoint_route_materialized(cls, endpoint_rule):
+        """Tell if given rule must be loaded in the routing map.
+
+        Always true unless lazy mode is on
+        and the rule's route prefix has not been requested yet.
+        Routes starting w/ a converter are always loaded.
+        """
+        if not cls._endpoint_route_config_flag("lazy"):
+            return True
+        prefixes = getattr(cls, "_endpoint_route_loaded_prefixes", None) or ()
+        prefix = route_prefix(endpoint_rule.route)
+        return route_prefix_is_dynamic(prefix) or prefix in prefixes
+
+    @classmethod
+    def _endpoint_route_materialize(cls, path_info):
+        """Load the rules under the prefix of given path in the routing map.
+
+        Enabled via `endpoint_route_lazy` config flag.
+        Known prefixes are loaded once per registry version,
+        hence paths w/o any matching endpoint do not hit the DB.
+
+        :return: True if rules have been loaded.
+        """
+        if not cls._endpoint_route_config_flag("lazy"):
+            return False
+        prefix = route_prefix(path_info)
+        with _routing_map_lock:
+            loaded = getattr(cls, "_endpoint_route_loaded_prefixes", None) or set()
+            if prefix in loaded:
+                return False
+            e_registry = cls._endpoint_route_registry(http.request.env.cr)
+            known = getattr(cls, "_endpoint_route_known_prefixes", None)
+            if known is None:
+                known = (
+                    cls._endpoint_route_known_prefixes
+                ) = e_registry.get_route_prefixes()
+            if prefix not in known:
+                return False
+            rules = list(e_registry.get_rules(prefixes=[prefix]))
+            # Replace the set rather than altering it
+            # as it might be read by a concurrent map generation.
+            cls._endpoint_route_loaded_prefixes = loaded | {prefix}
+            for routing_map in list(getattr(cls, "_routing_map", {}).values()):
+                cls._endpoint_routing_map_patch(routing_map, rules, (), groups=())
+            dispatcher = getattr(cls, "_endpoint_route_dispatcher", None)
+            if dispatcher is not None:
+                cls._endpoint_route_dispatcher_patch(dispatcher, rules, (), groups=())
+        _logger.info("Endpoint routes under /%s loaded: %s rule(s)", prefix, len(rules))
+        return True
+
+    @classmethod
+    def _endpoint_rule_routing_rules(cls, endpoint_rule):
+        """Yield routing rules for given endpoint rule."""
+        endpoint = endpoint_rule.endpoint
+        # Keep track of the rule to be able to patch the routing map
+        endpoint.endpoint_rule_key = endpoint_rule.key
+        endpoint.endpoint_rule_group = endpoint_rule.route_group or ""
+        for url in endpoint_rule.routing["routes"]:
+            yield (url, endpoint, endpoint_rule.routing)
+
+    @classmethod
+    def _endpoint_route_config_flag(cls, name):
+        """Read boolean flag `endpoint_route_$name` from server config."""
+        return tools.str2bool(tools.config.get("endpoint_route_" + name) or "0")
 
     @classmethod
     def routing_map(cls, key=None):
+        cls._endpoint_route_check_version()
+        return super().routing_map(key=key)
+
+    @classmethod
+    def _endpoint_route_check_version(cls):
+        """Refresh routing maps if the endpoint registry has changed."""
         # When the request cursor is used to instantiate the EndpointRegistry
         # in the call to routing_map, the READ REPEATABLE isolation level
         # will ensure that any value read from the DB afterwards, will be the
@@ -57,6 +165,12 @@ class IrHttp(models.AbstractModel):
         # ensure no read is performed on the database using the request cursor
         # which will in turn use the updated value of the oauth token to compute
         # the session token, and the security check will not fail.
+        if getattr(_local, "version_checked", False):
+            # Already done for current match
+            return
+        if cls._endpoint_route_version_notified_unchanged():
+            # No need to check the version on the DB
+            return
         registry = registry_get(http.request.env.cr.dbname)
         with registry.cursor() as cr:
             last_version = cls._get_routing_map_last_version(cr)
@@ -67,11 +181,345 @@ class IrHttp(models.AbstractModel):
                 # routing map just initialized, store last update for this env
                 cls._endpoint_route_last_version = last_version
             elif cls._endpoint_route_last_version < last_version:
-                _logger.info("Endpoint registry updated, reset routing map")
+                if not cls._endpoint_routing_map_update(cr):
+                    if cls._endpoint_route_rebuild_async(cr.dbname):
+                        # Keep serving current maps until new ones are swapped in
+                        return
+                    _logger.info("Endpoint registry updated, reset routing map")
+                    cls._routing_map = {}
+                    cls._rewrite_len = {}
+                    cls._endpoint_route_dispatcher = None
+                cls._endpoint_route_known_prefixes = None
+                cls._endpoint_route_last_version = last_version
+
+    @classmethod
+    def _endpoint_route_rebuild_async(cls, dbname):
+        """Rebuild routing maps in a helper thread.
+
+        Enabled via `endpoint_route_background_rebuild` config flag.
+        Requests keep using current maps while new ones are built.
+
+        :return: True if a rebuild is running, False if maps must be reset.
+        """
+        if not getattr(
+            cls, "_routing_map", None
+        ) or not cls._endpoint_route_config_flag("background_rebuild"):
+            return False
+        with _routing_map_lock:
+            if getattr(cls, "_endpoint_route_rebuild_thread", None) is None:
+                thread = threading.Thread(
+                    target=cls._endpoint_route_rebuild,
+                    args=(dbname,),
+                    name="endpoint_route.rebuild",
+                    daemon=True,
+                )
+                cls._endpoint_route_rebuild_thread = thread
+                thread.start()
+        return True
+
+    @classmethod
+    def _endpoint_route_rebuild(cls, dbname):
+        """Rebuild routing maps, to be run in a helper thread."""
+        threading.current_thread().dbname = dbname
+        try:
+            with registry_get(dbname).cursor() as cr:
+                cls._endpoint_route_rebuild_maps(cr)
+        except Exception:
+            _logger.exception("Endpoint routing map rebuild failed, reset it")
+            with _routing_map_lock:
                 cls._routing_map = {}
                 cls._rewrite_len = {}
-                cls._endpoint_route_last_version = last_version
-        return super().routing_map(key=key)
+                cls._endpoint_route_dispatcher = None
+        finally:
+            cls._endpoint_route_rebuild_thread = None
+
+    @classmethod
+    def _endpoint_route_rebuild_maps(cls, cr):
+        """Replace all endpoint rules of current routing maps.
+
+        Odoo's rules are left untouched as they do not change,
+        endpoint rules are all replaced w/ the ones loaded from the registry
+        (w/o `website` rewrites, as for delta updates).
+        """
+        e_registry = cls._endpoint_route_registry(cr)
+        # Read the version 1st: rules loaded afterwards are at least as recent
+        last_version = e_registry.last_version()
+        routing_maps = cls._routing_map
+        loaded = getattr(cls, "_endpoint_route_loaded_prefixes", None) or set()
+        rules = list(cls._endpoint_route_rules_to_load(e_registry))
+        dispatcher = None
+        if getattr(cls, "_endpoint_route_dispatcher", None) is not None:
+            dispatcher = EndpointRouteDispatcher(converters=cls._get_converters())
+            cls._endpoint_route_dispatcher_patch(dispatcher, rules, ())
+        with _routing_map_lock:
+            if cls._routing_map is not routing_maps:
+                # Reset in the meantime: new maps are generated from scratch
+                _logger.info("Endpoint routing maps reset, rebuild dropped")
+                return
+            # Prefixes materialized in the meantime are missing from loaded rules
+            added = (cls._endpoint_route_loaded_prefixes or set()) - loaded
+            if added:
+                added_rules = list(e_registry.get_rules(prefixes=added))
+                if dispatcher is not None:
+                    cls._endpoint_route_dispatcher_patch(
+                        dispatcher, added_rules, (), groups=()
+                    )
+                rules += added_rules
+            # Maps generated in the meantime are patched as well
+            for routing_map in list(routing_maps.values()):
+                cls._endpoint_routing_map_patch(routing_map, rules, ())
+            cls._endpoint_route_dispatcher = dispatcher
+            cls._endpoint_route_known_prefixes = None
+            cls._endpoint_route_last_version = max(
+                last_version, cls._endpoint_route_last_version
+            )
+        _logger.info(
+            "Endpoint routing maps rebuilt: %s rule(s), version %s",
+            len(rules),
+            last_version,
+        )
+
+    @classmethod
+    @contextmanager
+    def _endpoint_route_version_checked(cls):
+        """Skip version checks in the block as they've just been done."""
+        _local.version_checked = True
+        try:
+            yield
+        finally:
+            _local.version_checked = False
+
+    @classmethod
+    def _match(cls, path_info, key=None):
+        return cls._endpoint_route_match(
+            path_info, lambda: super(IrHttp, cls)._match(path_info, key=key)
+        )
+
+    @classmethod
+    def _find_handler(cls, return_rule=False):
+        rule, arguments = cls._endpoint_route_match(
+            http.request.httprequest.path,
+            lambda: super(IrHttp, cls)._find_handler(return_rule=True),
+        )
+        return (rule, arguments) if return_rule else (rule.endpoint, arguments)
+
+    @classmethod
+    def _endpoint_route_match(cls, path_info, map_match):
+        """Match given path via the dispatcher first, then via `map_match`.
+
+        In lazy mode, endpoint routes are loaded on the 1st miss for their prefix.
+        """
+        cls._endpoint_route_check_version()
+        with cls._endpoint_route_version_checked():
+            match = cls._endpoint_route_dispatch(path_info)
+            if match is not None:
+                return match
+            try:
+                return map_match()
+            except werkzeug.exceptions.NotFound:
+                if not cls._endpoint_route_materialize(path_info):
+                    raise
+            return cls._endpoint_route_dispatch(path_info) or map_match()
+
+    @classmethod
+    def _endpoint_route_dispatch(cls, path_info):
+        """Match static endpoint routes before going through the routing map.
+
+        Enabled via `endpoint_route_dispatcher` config flag.
+
+        :return: `(rule, arguments)` or None if no static route matches.
+        """
+        if not cls._endpoint_route_config_flag("dispatcher"):
+            return None
+        dispatcher = cls._endpoint_route_get_dispatcher()
+        return dispatcher.match(path_info, http.request.httprequest.method)
+
+    @classmethod
+    def _endpoint_route_dispatchable(cls, url, routing):
+        """Tell if given route can be served by the dispatcher.
+
+        Only static routes w/o special werkzeug options are.
+        """
+        special_keys = (
+            "subdomain",
+            "build_only",
+            "strict_slashes",
+            "redirect_to",
+            "alias",
+            "host",
+        )
+        return EndpointRouteDispatcher.is_static(url) and not any(
+            routing.get(k) for k in special_keys
+        )
+
+    @classmethod
+    def _endpoint_route_get_dispatcher(cls):
+        dispatcher = getattr(cls, "_endpoint_route_dispatcher", None)
+        if dispatcher is not None:
+            return dispatcher
+        with _routing_map_lock:
+            dispatcher = getattr(cls, "_endpoint_route_dispatcher", None)
+            if dispatcher is None:
+                dispatcher = EndpointRouteDispatcher(converters=cls._get_converters())
+                # Same as `_endpoint_routing_rules`
+                e_registry = cls._endpoint_route_registry(http.request.env.cr)
+                cls._endpoint_route_dispatcher_patch(
+                    dispatcher, cls._endpoint_route_rules_to_load(e_registry), ()
+                )
+                _logger.info("Endpoint dispatcher loaded: %s route(s)", len(dispatcher))
+                cls._endpoint_route_dispatcher = dispatcher
+        return dispatcher
+
+    @classmethod
+    def _endpoint_route_dispatcher_patch(
+        cls, dispatcher, rules, existing_keys, groups=None
+    ):
+        """Replace given rules in the dispatcher and drop non existing ones.
+
+        :param groups: if given, look for non existing rules only in these groups
+        """
+        for key in dispatcher.keys(groups=groups) - set(existing_keys):
+            dispatcher.discard(key)
+        for endpoint_rule in rules:
+            dispatcher.discard(endpoint_rule.key)
+            if not cls._endpoint_route_materialized(endpoint_rule):
+                continue
+            for url, endpoint, routing in cls._endpoint_rule_routing_rules(
+                endpoint_rule
+            ):
+                if cls._endpoint_route_dispatchable(url, routing):
+                    wz_rule = cls._endpoint_make_werkzeug_rule(url, endpoint, routing)
+                    dispatcher.add(
+                        endpoint_rule.key, endpoint_rule.route_group, wz_rule
+                    )
+
+    @classmethod
+    def _endpoint_route_version_notified_unchanged(cls):
+        """Check if the version is unchanged w/o hitting the DB.
+
+        Enabled via `endpoint_route_notify` config flag.
+        The version is kept up to date in memory by `version_listener`.
+        """
+        if not hasattr(cls, "_routing_map") or not cls._endpoint_route_config_flag(
+            "notify"
+        ):
+            return False
+        version = version_listener.get_version(http.request.env.cr.dbname)
+        if version is None:
+            return False
+        return version <= getattr(cls, "_endpoint_route_last_version", -1)
+
+    @classmethod
+    def _endpoint_routing_map_update(cls, cr):
+        """Update routing maps in place w/ the rules changed since last version.
+
+        Enabled via `endpoint_route_delta_update` config flag.
+        Only the rules of changed or deleted endpoints are replaced,
+        all the other rules (Odoo's ones included) are left untouched.
+        Deleted rules are looked up only in the route groups that changed.
+
+        NOTE: rules are added as they come from the registry,
+        `website` rewrites are not applied to them.
+
+        :return: True if maps have been updated, False if a reset is needed.
+        """
+        if not cls._routing_map or not cls._endpoint_route_config_flag("delta_update"):
+            return False
+        e_registry = cls._endpoint_route_registry(cr)
+        last_version = cls._endpoint_route_last_version
+        with _routing_map_lock:
+            groups = e_registry.last_group_versions(since=last_version)
+            if not groups:
+                return True
+            changed_rules = list(e_registry.get_rules_changed_since(last_version))
+            existing_keys = e_registry.get_keys(groups=groups)
+            for routing_map in list(cls._routing_map.values()):
+                cls._endpoint_routing_map_patch(
+                    routing_map, changed_rules, existing_keys, groups=groups
+                )
+            dispatcher = getattr(cls, "_endpoint_route_dispatcher", None)
+            if dispatcher is not None:
+                cls._endpoint_route_dispatcher_patch(
+                    dispatcher, changed_rules, existing_keys, groups=groups
+                )
+        _logger.info(
+            "Endpoint registry updated, %s rule(s) refreshed in routing map "
+            "for groups: %s",
+            len(changed_rules),
+            ", ".join(sorted(groups)),
+        )
+        return True
+
+    @classmethod
+    def _endpoint_routing_map_patch(
+        cls, routing_map, rules, existing_keys, groups=None
+    ):
+        """Replace given rules in given routing map and drop non existing ones.
+
+        Only the rules of given endpoints are compiled,
+        all the other rules (Odoo's ones included) are reused as they are.
+
+        Current lists of rules are not altered as they might be used
+        by concurrent matches: new ones are built aside and swapped in once sorted.
+
+        :param groups: if given, look for non existing rules only in these groups
+        :return: given routing map
+        """
+        to_drop = {rule.key for rule in rules}
+        dropped = set()
+        for endpoint in routing_map._rules_by_endpoint:
+            key = getattr(endpoint, "endpoint_rule_key", None)
+            if key and (
+                key in to_drop
+                or key not in existing_keys
+                and (groups is None or endpoint.endpoint_rule_group in groups)
+            ):
+                dropped.add(endpoint)
+        new_rules = []
+        use_dispatcher = cls._endpoint_route_config_flag("dispatcher")
+        for endpoint_rule in rules:
+            if not cls._endpoint_route_materialized(endpoint_rule):
+                continue
+            for url, endpoint, routing in cls._endpoint_rule_routing_rules(
+                endpoint_rule
+            ):
+                if use_dispatcher and cls._endpoint_route_dispatchable(url, routing):
+                    continue
+                wz_rule = cls._endpoint_make_werkzeug_rule(url, endpoint, routing)
+                wz_rule.bind(routing_map)
+                new_rules.append(wz_rule)
+        if not dropped and not new_rules:
+            return routing_map
+        # Same as `werkzeug.routing.Map.update`
+        rules_by_endpoint = {
+            endpoint: wz_rules
+            for endpoint, wz_rules in routing_map._rules_by_endpoint.items()
+            if endpoint not in dropped
+        }
+        for wz_rule in new_rules:
+            rules_by_endpoint[wz_rule.endpoint] = sorted(
+                rules_by_endpoint.get(wz_rule.endpoint, []) + [wz_rule],
+                key=lambda x: x.build_compare_key(),
+            )
+        wz_rules = [x for x in routing_map._rules if x.endpoint not in dropped]
+        wz_rules += new_rules
+        wz_rules.sort(key=lambda x: x.match_compare_key())
+        routing_map._rules_by_endpoint = rules_by_endpoint
+        routing_map._rules = wz_rules
+        return routing_map
+
+    @classmethod
+    def _endpoint_make_werkzeug_rule(cls, url, endpoint, routing):
+        # Mimic what `ir.http.routing_map` does for each rule
+        xtra_keys = (
+            "defaults subdomain build_only strict_slashes redirect_to alias host"
+        ).split()
+        kw = {k: routing[k] for k in xtra_keys if k in routing}
+        rule = werkzeug.routing.Rule(
+            url, endpoint=endpoint, methods=routing["methods"], **kw
+        )
+        rule.merge_slashes = False
+        return rule
 
     @classmethod
     def _get_routing_map_last_version(cls, cr):
@@ -82,6 +530,9 @@ class IrHttp(models.AbstractModel):
         super()._clear_routing_map()
         if hasattr(cls, "_endpoint_route_last_version"):
             cls._endpoint_route_last_version = 0
+        cls._endpoint_route_dispatcher = None
+        cls._endpoint_route_loaded_prefixes = None
+        cls._endpoint_route_known_prefixes = None
 
     @classmethod
     def _auth_method_user_endpoint(cls):
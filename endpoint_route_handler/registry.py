@@ -5,7 +5,9 @@
 import importlib
 import json
 import logging
-from functools import partial
+import sys
+import uuid
+from functools import lru_cache, partial
 
 from psycopg2 import sql
 from psycopg2.extensions import AsIs
@@ -14,29 +16,53 @@ from psycopg2.extras import execute_values
 from odoo import http, tools
 from odoo.tools import DotDict
 
-from odoo.addons.base.models.ir_model import query_insert
-
 from .exceptions import EndpointHandlerNotFound
 
 _logger = logging.getLogger(__name__)
 
 
-def query_multi_update(cr, table_name, rows, cols):
+def _values_template(cols, col_types):
+    # eg: (%(key)s,%(opts)s::jsonb)
+    values = [
+        "%({})s".format(col) + ("::" + col_types[col] if col in col_types else "")
+        for col in cols
+    ]
+    return sql.SQL("(") + sql.SQL(",").join(map(sql.SQL, values)) + sql.SQL(")")
+
+
+def _distinct_condition(cols, left, right):
+    # eg: (t.key, t.route) IS DISTINCT FROM (c.key, c.route)
+    return sql.SQL("({}) IS DISTINCT FROM ({})").format(
+        sql.SQL(",").join(
+            [
+                sql.SQL("{}.{}").format(sql.Identifier(left), sql.Identifier(col))
+                for col in cols
+            ]
+        ),
+        sql.SQL(",").join(
+            [
+                sql.SQL("{}.{}").format(sql.Identifier(right), sql.Identifier(col))
+                for col in cols
+            ]
+        ),
+    )
+
+
+def query_multi_update(cr, table_name, rows, cols, col_types=None):
     """Update multiple rows at once.
 
+    Rows whose values are unchanged are not touched.
+
     :param `cr`: active db cursor
     :param `table_name`: sql table to update
     :param `rows`: list of dictionaries with write-ready values
     :param `cols`: list of keys representing columns' names
+    :param `col_types`: mapping of column names to sql types to cast values to
     """
     # eg: key=c.key, route=c.route
     keys = sql.SQL(",").join([sql.SQL("{0}=c.{0}".format(col)) for col in cols])
     col_names = sql.SQL(",").join([sql.Identifier(col) for col in cols])
-    template = (
-        sql.SQL("(")
-        + sql.SQL(",").join([sql.SQL("%({})s".format(col)) for col in cols])
-        + sql.SQL(")")
-    )
+    template = _values_template(cols, col_types or {})
     query = sql.SQL(
         """
     UPDATE {table} AS t SET
@@ -44,6 +70,7 @@ def query_multi_update(cr, table_name, rows, cols):
     FROM (VALUES {values})
         AS c({col_names})
     WHERE c.key = t.key
+    AND {distinct}
     RETURNING t.key
     """
     ).format(
@@ -51,6 +78,7 @@ def query_multi_update(cr, table_name, rows, cols):
         keys=keys,
         col_names=col_names,
         values=sql.Placeholder(),
+        distinct=_distinct_condition(cols, "t", "c"),
     )
     execute_values(
         cr,
@@ -60,6 +88,123 @@ def query_multi_update(cr, table_name, rows, cols):
     )
 
 
+@lru_cache(maxsize=None)
+def resolve_handler(klass_dotted_path, method_name):
+    """Resolve endpoint handler for given controller klass and method.
+
+    Lookup happens by:
+
+        1. importing the controller klass module
+        2. loading the klass
+        3. accessing the method via its name
+
+    If any of them is not found, a specific exception is raised.
+
+    Results are memoized per process: all the rules using the same handler
+    share the same controller instance.
+    Use `resolve_handler.cache_info()` to inspect hits and misses.
+    """
+    mod_path, klass_name = klass_dotted_path.rsplit(".", 1)
+    try:
+        mod = importlib.import_module(mod_path)
+    except ImportError as exc:
+        raise EndpointHandlerNotFound(f"Module `{mod_path}` not found") from exc
+    try:
+        klass = getattr(mod, klass_name)
+    except AttributeError as exc:
+        raise EndpointHandlerNotFound(f"Class `{klass_name}` not found") from exc
+    try:
+        method = getattr(klass(), method_name)
+    except AttributeError as exc:
+        raise EndpointHandlerNotFound(f"Method name `{method_name}` not found") from exc
+    return method
+
+
+def intern_json(value):
+    """Return a copy of given json-like value w/ interned strings.
+
+    Keys and values repeated among rules (eg: `routes`, `methods`, handler paths)
+    are then shared in memory instead of being held by each rule.
+    """
+    if isinstance(value, str):
+        return sys.intern(value)
+    if isinstance(value, dict):
+        return {intern_json(k): intern_json(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return type(value)(intern_json(v) for v in value)
+    return value
+
+
+def route_prefix(route):
+    """Return the first segment of given route, eg: `/foo/bar` -> `foo`.
+
+    Same as `split_part(route, '/', 2)` on the DB.
+    """
+    parts = route.split("/", 2)
+    return parts[1] if len(parts) > 1 else ""
+
+
+def route_prefix_is_dynamic(prefix):
+    """Tell if given route prefix holds a converter, eg: `<string:foo>`.
+
+    Routes under such a prefix can match any first segment of a path.
+    """
+    return "<" in prefix
+
+
+def query_upsert(
+    cr, table_name, rows, cols, conflict_col, col_types=None, page_size=1000
+):
+    """Insert or update multiple rows at once.
+
+    Existing rows whose values are unchanged are not touched,
+    hence no update trigger is fired for them.
+
+    Rows are written by pages of `page_size` rows.
+
+    :param `cr`: active db cursor
+    :param `table_name`: sql table to update
+    :param `rows`: list of dictionaries with write-ready values
+    :param `cols`: list of keys representing columns' names
+    :param `conflict_col`: unique column identifying existing rows
+    :param `col_types`: mapping of column names to sql types to cast values to
+    :param `page_size`: max number of rows written by each statement
+    :return: list of `(conflict_col value, inserted)` tuples
+    """
+    # eg: key=EXCLUDED.key, route=EXCLUDED.route
+    keys = sql.SQL(",").join(
+        [sql.SQL("{0}=EXCLUDED.{0}").format(sql.Identifier(col)) for col in cols]
+    )
+    col_names = sql.SQL(",").join([sql.Identifier(col) for col in cols])
+    template = _values_template(cols, col_types or {})
+    # `xmax` is 0 only for freshly inserted rows
+    query = sql.SQL(
+        """
+    INSERT INTO {table} AS t ({col_names})
+    VALUES {values}
+    ON CONFLICT ({conflict_col}) DO UPDATE SET
+        {keys}
+    WHERE {distinct}
+    RETURNING t.{conflict_col}, (t.xmax = 0)
+    """
+    ).format(
+        table=sql.Identifier(table_name),
+        col_names=col_names,
+        values=sql.Placeholder(),
+        conflict_col=sql.Identifier(conflict_col),
+        keys=keys,
+        distinct=_distinct_condition(cols, "t", "excluded"),
+    )
+    return execute_values(
+        cr,
+        query.as_string(cr._cnx),
+        rows,
+        template=template.as_string(cr._cnx),
+        page_size=page_size,
+        fetch=True,
+    )
+
+
 class EndpointRegistry:
     """Registry for endpoints.
 
@@ -75,11 +220,24 @@ class EndpointRegistry:
         # name, type, comment
         ("key", "VARCHAR", ""),
         ("route", "VARCHAR", ""),
-        ("opts", "text", ""),
-        ("routing", "text", ""),
+        ("opts", "jsonb", ""),
+        ("routing", "jsonb", ""),
         ("endpoint_hash", "VARCHAR(32)", ""),
         ("route_group", "VARCHAR(32)", ""),
         ("updated_at", "TIMESTAMP NOT NULL DEFAULT NOW()", ""),
+        # Value of `endpoint_route_version` when the row was last touched
+        ("version", "BIGINT NOT NULL DEFAULT 0", ""),
+    )
+    # Columns to load rules from, see `EndpointRule.from_row`
+    _rule_columns = (
+        "id",
+        "key",
+        "route",
+        "opts",
+        "routing",
+        "endpoint_hash",
+        "route_group",
+        "updated_at",
     )
 
     @classmethod
@@ -99,6 +257,57 @@ class EndpointRegistry:
             cls._setup_db_version(cr)
             _logger.info("endpoint_route table set up")
 
+    @classmethod
+    def _setup_db_columns(cls, cr):
+        """Add columns missing from an existing routing table"""
+        for name, type_, comment in cls._columns:
+            if not tools.sql.column_exists(cr, cls._table, name):
+                tools.sql.create_column(cr, cls._table, name, type_, comment=comment)
+                _logger.info("endpoint_route column %s added", name)
+
+    @classmethod
+    def _setup_db_json_columns(cls, cr):
+        """Convert json columns from text to jsonb"""
+        columns = tools.sql.table_columns(cr, cls._table)
+        for name, type_, __ in cls._columns:
+            if type_ != "jsonb" or columns[name]["udt_name"] == "jsonb":
+                continue
+            cr.execute(
+                sql.SQL("ALTER TABLE {0} ALTER COLUMN {1} TYPE jsonb USING {1}::jsonb")
+                .format(sql.Identifier(cls._table), sql.Identifier(name))
+                .as_string(cr._cnx)
+            )
+            _logger.info("endpoint_route column %s converted to jsonb", name)
+
+    @classmethod
+    def _setup_db_route_group_index(cls, cr):
+        """Create index to lookup rules by group"""
+        if not tools.sql.index_exists(cr, "endpoint_route__route_group_index"):
+            tools.sql.create_index(
+                cr, "endpoint_route__route_group_index", cls._table, ["route_group"]
+            )
+
+    @classmethod
+    def _setup_db_route_prefix_index(cls, cr):
+        """Create index to lookup rules by route prefix, see `route_prefix`"""
+        if not tools.sql.index_exists(cr, "endpoint_route__route_prefix_index"):
+            tools.sql.create_index(
+                cr,
+                "endpoint_route__route_prefix_index",
+                cls._table,
+                ["(split_part(route, '/', 2))"],
+            )
+
+    @classmethod
+    def _setup_db_routing_index(cls, cr):
+        """Create index to filter rules by routing attributes"""
+        cr.execute(
+            """
+            CREATE INDEX IF NOT EXISTS endpoint_route__routing_index
+            ON endpoint_route USING gin (routing jsonb_path_ops)
+        """
+        )
+
     @classmethod
     def _setup_db_table(cls, cr):
         """Create routing table and indexes"""
@@ -117,6 +326,9 @@ class EndpointRegistry:
             "endpoint_route__endpoint_hash_uniq",
             "unique(endpoint_hash)",
         )
+        cls._setup_db_routing_index(cr)
+        cls._setup_db_route_group_index(cr)
+        cls._setup_db_route_prefix_index(cr)
 
     @classmethod
     def _setup_db_timestamp(cls, cr):
@@ -144,73 +356,333 @@ class EndpointRegistry:
 
     @classmethod
     def _setup_db_version(cls, cr):
-        """Create sequence and triggers to keep track of routes' version"""
+        """Create sequence and triggers to keep track of routes' version.
+
+        Each insert, update or delete statement touching at least one row
+        bumps the sequence once.
+        Inserted and updated rows get stamped with the new version
+        so that consumers can retrieve only what changed since a given version.
+
+        The version of each route group is tracked as well
+        in `endpoint_route_group_version`.
+
+        Every statement touching the table also sends the new version
+        as a notification on the `endpoint_route_version` channel
+        (delivered on commit), see `listener.EndpointRouteVersionListener`.
+        """
         cr.execute(
             """
             SELECT 1  FROM pg_class WHERE RELNAME = 'endpoint_route_version'
         """
         )
         if not cr.fetchone():
-            sql = """
-                CREATE SEQUENCE endpoint_route_version INCREMENT BY 1 START WITH 1;
-                CREATE OR REPLACE FUNCTION increment_endpoint_route_version()
-                    RETURNS TRIGGER AS $$
-                BEGIN
-                  PERFORM nextval('endpoint_route_version');
-                  RETURN NEW;
-                END;
-                $$ language plpgsql;
-                CREATE TRIGGER  update_endpoint_route_version_trigger
-                    BEFORE INSERT ON %(table)s
-                   for each row execute procedure increment_endpoint_route_version();
-                CREATE TRIGGER  insert_endpoint_route_version_trigger
-                    BEFORE UPDATE ON %(table)s
-                   for each row execute procedure increment_endpoint_route_version();
+            cr.execute(
+                "CREATE SEQUENCE endpoint_route_version INCREMENT BY 1 START WITH 1;"
+            )
+        cls._setup_db_group_version(cr)
+        sql = """
+            -- The version of the current statement is kept in a local setting,
+            -- along w/ the key of the statement (see below), and the sequence
+            -- is bumped only when the 1st row is touched.
+            -- The key is not reset by a statement level trigger
+            -- as such triggers are fired by each part of data-modifying CTEs
+            -- and by both the insert and the update of `INSERT ON CONFLICT`.
+            CREATE OR REPLACE FUNCTION endpoint_route_statement_key()
+                RETURNS TEXT AS $$
+              SELECT txid_current()::text || '@' || statement_timestamp()::text;
+            $$ language sql;
+            CREATE OR REPLACE FUNCTION endpoint_route_statement_version()
+                RETURNS BIGINT AS $$
+              SELECT split_part(s.setting, '|', 2)::bigint
+              FROM (
+                SELECT current_setting(
+                  'endpoint_route.statement_version', true
+                ) AS setting
+              ) AS s
+              WHERE split_part(s.setting, '|', 1) = endpoint_route_statement_key();
+            $$ language sql;
+            CREATE OR REPLACE FUNCTION increment_endpoint_route_version()
+                RETURNS TRIGGER AS $$
+            DECLARE
+              current_version BIGINT := endpoint_route_statement_version();
+            BEGIN
+              IF TG_OP = 'INSERT' AND EXISTS (
+                SELECT 1 FROM %(table)s WHERE key = NEW.key
+              ) THEN
+                -- Turned into an update by `ON CONFLICT` (or failing):
+                -- the version is bumped only if the row is really updated.
+                RETURN NEW;
+              END IF;
+              IF current_version IS NULL THEN
+                current_version := nextval('endpoint_route_version');
+                PERFORM set_config(
+                  'endpoint_route.statement_version',
+                  endpoint_route_statement_key() || '|' || current_version::text,
+                  true
+                );
+              END IF;
+              IF TG_OP = 'DELETE' THEN
+                RETURN OLD;
+              END IF;
+              NEW.version = current_version;
+              RETURN NEW;
+            END;
+            $$ language plpgsql;
+            CREATE OR REPLACE FUNCTION update_endpoint_route_group_version()
+                RETURNS TRIGGER AS $$
+            DECLARE
+              current_version BIGINT := endpoint_route_statement_version();
+            BEGIN
+              IF current_version IS NULL THEN
+                -- No row touched
+                RETURN NULL;
+              END IF;
+              -- Only the rows of this trigger's transition tables are looked at:
+              -- the statement might be fired along w/ others sharing its version.
+              IF TG_OP = 'INSERT' THEN
+                INSERT INTO endpoint_route_group_version (route_group, version)
+                  SELECT DISTINCT coalesce(route_group, ''), current_version
+                  FROM new_rows
+                ON CONFLICT (route_group) DO UPDATE
+                  SET version = GREATEST(
+                    endpoint_route_group_version.version, EXCLUDED.version
+                  );
+              ELSIF TG_OP = 'UPDATE' THEN
+                INSERT INTO endpoint_route_group_version (route_group, version)
+                  SELECT coalesce(route_group, ''), current_version
+                  FROM (
+                    SELECT route_group FROM new_rows
+                    UNION
+                    SELECT route_group FROM old_rows
+                  ) AS changed_groups
+                ON CONFLICT (route_group) DO UPDATE
+                  SET version = GREATEST(
+                    endpoint_route_group_version.version, EXCLUDED.version
+                  );
+              ELSE
+                INSERT INTO endpoint_route_group_version (route_group, version)
+                  SELECT DISTINCT coalesce(route_group, ''), current_version
+                  FROM old_rows
+                ON CONFLICT (route_group) DO UPDATE
+                  SET version = GREATEST(
+                    endpoint_route_group_version.version, EXCLUDED.version
+                  );
+              END IF;
+              IF FOUND THEN
+                PERFORM pg_notify(
+                  'endpoint_route_version', current_version::text
+                );
+              END IF;
+              RETURN NULL;
+            END;
+            $$ language plpgsql;
+            DROP TRIGGER IF EXISTS notify_endpoint_route_version_trigger
+                ON %(table)s;
+            DROP FUNCTION IF EXISTS notify_endpoint_route_version();
+            DROP TRIGGER IF EXISTS reset_endpoint_route_version_trigger
+                ON %(table)s;
+            DROP FUNCTION IF EXISTS reset_endpoint_route_version();
+            DROP TRIGGER IF EXISTS update_endpoint_route_version_trigger
+                ON %(table)s;
+            CREATE TRIGGER  update_endpoint_route_version_trigger
+                BEFORE INSERT ON %(table)s
+               for each row execute procedure increment_endpoint_route_version();
+            DROP TRIGGER IF EXISTS insert_endpoint_route_version_trigger
+                ON %(table)s;
+            CREATE TRIGGER  insert_endpoint_route_version_trigger
+                BEFORE UPDATE ON %(table)s
+               for each row execute procedure increment_endpoint_route_version();
+            DROP TRIGGER IF EXISTS delete_endpoint_route_version_trigger
+                ON %(table)s;
+            CREATE TRIGGER  delete_endpoint_route_version_trigger
+                BEFORE DELETE ON %(table)s
+               for each row execute procedure increment_endpoint_route_version();
+            DROP TRIGGER IF EXISTS insert_endpoint_route_group_version_trigger
+                ON %(table)s;
+            CREATE TRIGGER  insert_endpoint_route_group_version_trigger
+                AFTER INSERT ON %(table)s
+                REFERENCING NEW TABLE AS new_rows
+               for each statement execute procedure update_endpoint_route_group_version();
+            DROP TRIGGER IF EXISTS update_endpoint_route_group_version_trigger
+                ON %(table)s;
+            CREATE TRIGGER  update_endpoint_route_group_version_trigger
+                AFTER UPDATE ON %(table)s
+                REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+               for each statement execute procedure update_endpoint_route_group_version();
+            DROP TRIGGER IF EXISTS delete_endpoint_route_group_version_trigger
+                ON %(table)s;
+            CREATE TRIGGER  delete_endpoint_route_group_version_trigger
+                AFTER DELETE ON %(table)s
+                REFERENCING OLD TABLE AS old_rows
+               for each statement execute procedure update_endpoint_route_group_version();
+        """
+        cr.execute(sql, {"table": AsIs(cls._table)})
+
+    @classmethod
+    def _setup_db_group_version(cls, cr):
+        """Create table to keep track of the version of each route group.
+
+        Rules w/o group are tracked under an empty group name.
+        """
+        if tools.sql.table_exists(cr, "endpoint_route_group_version"):
+            return
+        cr.execute(
             """
-            cr.execute(sql, {"table": AsIs(cls._table)})
+            CREATE TABLE endpoint_route_group_version (
+                route_group VARCHAR PRIMARY KEY,
+                version BIGINT NOT NULL DEFAULT 0
+            )
+        """
+        )
+        cr.execute(
+            """
+            INSERT INTO endpoint_route_group_version (route_group, version)
+            SELECT coalesce(route_group, ''), max(version)
+            FROM endpoint_route
+            GROUP BY coalesce(route_group, '')
+        """
+        )
 
     def __init__(self, cr):
         self.cr = cr
 
-    def get_rules(self, keys=None, where=None):
-        for row in self._get_rules(keys=keys, where=where):
+    def get_rules(
+        self,
+        keys=None,
+        where=None,
+        routing=None,
+        where_params=None,
+        stream=False,
+        groups=None,
+        prefixes=None,
+    ):
+        """Retrieve rules.
+
+        :param keys: list of rule keys to filter on
+        :param groups: list of route groups to filter on
+        :param prefixes: list of route prefixes to filter on, see `route_prefix`
+        :param where: custom `WHERE` clause, other filters are ignored
+        :param routing: dictionary of routing attributes to filter on.
+            Filtering happens on the DB via jsonb containment,
+            eg: `{"auth": "public", "methods": ["GET"]}`
+            matches public rules allowing GET method.
+        :param where_params: parameters for the custom `WHERE` clause
+        :param stream: fetch rows in batches via a server side cursor
+            instead of loading them all at once.
+            Use it to walk big registries w/ bounded memory.
+        """
+        kw = dict(
+            keys=keys,
+            where=where,
+            where_params=where_params,
+            routing=routing,
+            groups=groups,
+            prefixes=prefixes,
+        )
+        rows = self._stream_rules(**kw) if stream else self._get_rules(**kw)
+        for row in rows:
             yield EndpointRule.from_row(self.cr.dbname, row)
 
-    def _get_rules(self, keys=None, where=None, one=False):
-        query = "SELECT * FROM endpoint_route"
+    def _get_rules_query(
+        self,
+        keys=None,
+        where=None,
+        where_params=None,
+        routing=None,
+        groups=None,
+        prefixes=None,
+    ):
+        query = "SELECT {} FROM endpoint_route".format(", ".join(self._rule_columns))
         pargs = ()
-        if keys and not where:
-            query += " WHERE key IN %s"
-            pargs = (tuple(keys),)
-        elif where:
+        if where:
             query += " " + where
+            pargs = tuple(where_params or ())
+        else:
+            clauses = []
+            if keys:
+                clauses.append("key IN %s")
+                pargs += (tuple(keys),)
+            if groups:
+                clauses.append("route_group IN %s")
+                pargs += (tuple(groups),)
+            if prefixes:
+                clauses.append("split_part(route, '/', 2) IN %s")
+                pargs += (tuple(prefixes),)
+            if routing:
+                clauses.append("routing @> %s::jsonb")
+                pargs += (json.dumps(routing),)
+            if clauses:
+                query += " WHERE " + " AND ".join(clauses)
+        return query, pargs
+
+    def _get_rules(self, one=False, **kw):
+        query, pargs = self._get_rules_query(**kw)
         self.cr.execute(query, pargs)
         return self.cr.fetchone() if one else self.cr.fetchall()
 
+    # Number of rows fetched at once when streaming rules
+    _stream_batch_size = 1000
+
+    def _stream_rules(self, batch_size=None, **kw):
+        """Yield rules' rows fetched in batches from a server side cursor."""
+        batch_size = batch_size or self._stream_batch_size
+        query, pargs = self._get_rules_query(**kw)
+        # Named cursors live in the current transaction of the connection
+        name = "endpoint_route_stream_{}".format(uuid.uuid4().hex)
+        with self.cr._cnx.cursor(name=name) as stream_cr:
+            stream_cr.itersize = batch_size
+            stream_cr.execute(query, pargs)
+            while True:
+                rows = stream_cr.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield from rows
+
     def _get_rule(self, key):
         row = self._get_rules(keys=(key,), one=True)
         if row:
             return EndpointRule.from_row(self.cr.dbname, row)
 
-    def _lock_rows(self, keys):
-        sql = "SELECT id FROM endpoint_route WHERE key IN %s FOR UPDATE"
-        self.cr.execute(sql, (tuple(keys),), log_exceptions=False)
+    def get_rules_changed_since(self, version):
+        """Retrieve rules inserted or updated after given version."""
+        return self.get_rules(where="WHERE version > %s", where_params=(version,))
 
-    def _update(self, rows_mapping):
-        self._lock_rows(tuple(rows_mapping.keys()))
-        return query_multi_update(
-            self.cr,
-            self._table,
-            tuple(rows_mapping.values()),
-            EndpointRule._ordered_columns(),
-        )
+    def get_keys(self, groups=None):
+        """Retrieve the keys of all registered rules.
 
-    def _create(self, rows_mapping):
-        return query_insert(self.cr, self._table, list(rows_mapping.values()))
+        :param groups: restrict to the rules of given route groups
+        """
+        if groups is None:
+            self.cr.execute("SELECT key FROM endpoint_route")
+        elif not groups:
+            return set()
+        else:
+            self.cr.execute(
+                "SELECT key FROM endpoint_route "
+                "WHERE coalesce(route_group, '') IN %s",
+                (tuple(groups),),
+            )
+        return {row[0] for row in self.cr.fetchall()}
+
+    def get_route_prefixes(self):
+        """Retrieve the prefixes of all registered routes, see `route_prefix`."""
+        self.cr.execute("SELECT DISTINCT split_part(route, '/', 2) FROM endpoint_route")
+        return {row[0] for row in self.cr.fetchall()}
+
+    @classmethod
+    def _col_types(cls):
+        """Map column names to their sql types (w/o constraints)."""
+        return {name: type_.split()[0] for name, type_, __ in cls._columns}
+
+    def get_rules_by_group(self, group, stream=False):
+        """Retrieve rules of given group(s).
 
-    def get_rules_by_group(self, group):
-        rules = self.get_rules(where=f"WHERE route_group='{group}'")
-        return rules
+        :param group: name of the group or list of names
+        """
+        groups = [group] if isinstance(group, str) else list(group)
+        if not groups:
+            return iter(())
+        return self.get_rules(groups=groups, stream=stream)
 
     def update_rules(self, rules, init=False):
         """Add or update rules.
@@ -219,23 +691,33 @@ class EndpointRegistry:
         :param force: replace rules forcedly
         :param init: given when adding rules for the first time
         """
-        keys = [x.key for x in rules]
-        existing = {x.key: x for x in self.get_rules(keys=keys)}
-        to_create = {}
-        to_update = {}
-        for rule in rules:
-            if rule.key in existing:
-                to_update[rule.key] = rule.to_row()
-            else:
-                to_create[rule.key] = rule.to_row()
-        res = False
-        if to_create:
-            self._create(to_create)
-            res = True
-        if to_update:
-            self._update(to_update)
-            res = True
-        return res
+        created, updated = self.upsert_rules(rules)
+        return bool(created or updated)
+
+    def upsert_rules(self, rules):
+        """Add or update rules.
+
+        Rules identical to the registered ones are not written,
+        hence they do not bump the registry version.
+
+        :param rule: list of instances of EndpointRule
+        :return: tuple of lists of created and really updated keys
+        """
+        # Last one wins if the same key is passed more than once
+        rows_mapping = {rule.key: rule.to_row() for rule in rules}
+        if not rows_mapping:
+            return [], []
+        res = query_upsert(
+            self.cr,
+            self._table,
+            tuple(rows_mapping.values()),
+            EndpointRule._ordered_columns(),
+            "key",
+            col_types=self._col_types(),
+        )
+        created = [key for key, inserted in res if inserted]
+        updated = [key for key, inserted in res if not inserted]
+        return created, updated
 
     def drop_rules(self, keys):
         self.cr.execute("DELETE FROM endpoint_route WHERE key IN %s", (tuple(keys),))
@@ -258,6 +740,21 @@ class EndpointRegistry:
             return res[0].timestamp()
         return 0.0
 
+    def last_group_versions(self, since=None):
+        """Return the last version of route groups.
+
+        :param since: return only groups changed after this version
+        :return: dictionary of versions by group name,
+            rules w/o group are found under an empty name
+        """
+        query = "SELECT route_group, version FROM endpoint_route_group_version"
+        pargs = ()
+        if since is not None:
+            query += " WHERE version > %s"
+            pargs = (since,)
+        self.cr.execute(query, pargs)
+        return dict(self.cr.fetchall())
+
     def last_version(self):
         self.cr.execute(
             """
@@ -308,7 +805,7 @@ class EndpointRule:
 
     @property
     def options(self):
-        return DotDict(self.opts)
+        return self.opts
 
     @options.setter
     def options(self, value):
@@ -318,22 +815,26 @@ class EndpointRule:
         """
         assert "klass_dotted_path" in value["handler"]
         assert "method_name" in value["handler"]
-        self.opts = value
+        # Stored as DotDict once for all: attribute access on plain dicts
+        # would return a new copy each time.
+        self.opts = DotDict(value, handler=DotDict(value["handler"]))
 
     @classmethod
     def from_row(cls, dbname, row):
         key, route, options, routing, endpoint_hash, route_group = row[1:-1]
-        # TODO: #jsonb-ref
-        options = json.loads(options)
-        routing = json.loads(routing)
+        # jsonb values are decoded by psycopg2 already
+        if isinstance(options, str):
+            options = json.loads(options)
+        if isinstance(routing, str):
+            routing = json.loads(routing)
         init_args = (
             dbname,
             key,
             route,
-            options,
-            routing,
+            intern_json(options),
+            intern_json(routing),
             endpoint_hash,
-            route_group,
+            intern_json(route_group),
         )
         return cls(*init_args)
 
@@ -368,28 +869,9 @@ class EndpointRule:
             * the controller's klass via `klass_dotted_path`
             * the controller's method to use via `method_name`
 
-        Lookup happens by:
-
-            1. importing the controller klass module
-            2. loading the klass
-            3. accessing the method via its name
-
-        If any of them is not found, a specific exception is raised.
+        See `resolve_handler` for the lookup.
         """
-        mod_path, klass_name = self.handler_options.klass_dotted_path.rsplit(".", 1)
-        try:
-            mod = importlib.import_module(mod_path)
-        except ImportError as exc:
-            raise EndpointHandlerNotFound(f"Module `{mod_path}` not found") from exc
-        try:
-            klass = getattr(mod, klass_name)
-        except AttributeError as exc:
-            raise EndpointHandlerNotFound(f"Class `{klass_name}` not found") from exc
-        method_name = self.handler_options.method_name
-        try:
-            method = getattr(klass(), method_name)
-        except AttributeError as exc:
-            raise EndpointHandlerNotFound(
-                f"Method name `{method_name}` not found"
-            ) from exc
-        return method
+        handler_options = self.handler_options
+        return resolve_handler(
+            handler_options.klass_dotted_path, handler_options.method_name
+        )
@@ -2,10 +2,16 @@
 # @author: Simone Orsi <simone.orsi@camptocamp.com>
 # License LGPL-3.0 or later (http://www.gnu.org/licenses/lgpl).
 from contextlib import contextmanager
+from unittest import mock
+
+import werkzeug
 
 import odoo
+from odoo import tools
 from odoo.tools import mute_logger
 
+from ..benchmarks import registry_scale
+from ..listener import EndpointRouteVersionListener
 from ..registry import EndpointRegistry
 from .common import CommonEndpoint
 from .fake_controllers import CTRLFake
@@ -50,6 +56,20 @@ class TestEndpoint(CommonEndpoint):
         new_route.route += "/new"
         self.assertNotEqual(new_route.endpoint_hash, first_hash)
 
+    def test_endpoint_hash_stable(self):
+        new_route = make_new_route(self.env)
+        self.assertEqual(len(new_route.endpoint_hash), 32)
+        # Same values, same hash: does not depend on the process nor the record
+        expected = new_route._make_endpoint_hash(
+            {
+                "route": "/my/test/route",
+                "auth_type": "user_endpoint",
+                "request_method": "GET",
+            }
+        )
+        self.assertEqual(new_route.endpoint_hash, expected)
+        self.assertEqual(make_new_route(self.env).endpoint_hash, expected)
+
     @mute_logger("odoo.addons.base.models.ir_http")
     def test_as_tool_register_single_controller(self):
         new_route = make_new_route(self.env)
@@ -117,6 +137,322 @@ class TestEndpoint(CommonEndpoint):
             rmap = self.env["ir.http"].routing_map()
             self.assertIn(route, [x.rule for x in rmap._rules])
 
+    @mute_logger("odoo.addons.base.models.ir_http")
+    def test_routing_map_patch(self):
+        options = {
+            "handler": {
+                "klass_dotted_path": CTRLFake._path,
+                "method_name": "custom_handler",
+            }
+        }
+        route1 = make_new_route(self.env)
+        route2 = make_new_route(self.env, route="/my/other/route")
+        (route1 | route2)._register_controllers(options=options)
+        ir_http = self.env["ir.http"]
+        reg = EndpointRegistry.registry_for(self.env.cr)
+        with self._get_mocked_request():
+            rmap = ir_http.routing_map()
+            rules_in_use = rmap._rules
+            odoo_rules = [x for x in rmap._rules if not x.rule.startswith("/my/")]
+            route1.route += "/new"
+            route1._register_controllers(options=options)
+            route2._unregister_controllers()
+            rules = list(reg.get_rules(keys=[route1._endpoint_registry_unique_key()]))
+            new_map = ir_http._endpoint_routing_map_patch(rmap, rules, reg.get_keys())
+            self.assertIs(new_map, rmap)
+            # The list of rules in use is left untouched
+            self.assertIsNot(rmap._rules, rules_in_use)
+            self.assertIn("/my/other/route", [x.rule for x in rules_in_use])
+            urls = [x.rule for x in rmap._rules]
+            self.assertNotIn("/my/test/route", urls)
+            self.assertNotIn("/my/other/route", urls)
+            self.assertIn("/my/test/route/new", urls)
+            # Odoo's rules are not compiled again
+            self.assertEqual(
+                [id(x) for x in rmap._rules if not x.rule.startswith("/my/")],
+                [id(x) for x in odoo_rules],
+            )
+            self.assertNotIn(
+                route2._endpoint_registry_unique_key(),
+                [
+                    getattr(x, "endpoint_rule_key", None)
+                    for x in rmap._rules_by_endpoint
+                ],
+            )
+            # Ensure the new rule is matched
+            adapter = rmap.bind("localhost")
+            rule, __ = adapter.match("/my/test/route/new", return_rule=True)
+            self.assertEqual(
+                rule.endpoint.endpoint_rule_key,
+                route1._endpoint_registry_unique_key(),
+            )
+
+    @mute_logger("odoo.addons.base.models.ir_http")
+    def test_dispatcher(self):
+        options = {
+            "handler": {
+                "klass_dotted_path": CTRLFake._path,
+                "method_name": "custom_handler",
+            }
+        }
+        route1 = make_new_route(self.env)
+        route2 = make_new_route(self.env, route="/my/app/<model(app.model):foo>")
+        (route1 | route2)._register_controllers(options=options)
+        ir_http = self.env["ir.http"]
+        reg = EndpointRegistry.registry_for(self.env.cr)
+        config = {"endpoint_route_dispatcher": "1"}
+        httprequest = {"method": "GET", "path": "/my/test/route"}
+        with self._get_mocked_request(httprequest=httprequest), mock.patch.dict(
+            tools.config.options, config
+        ):
+            # Static routes are kept out of the routing map
+            urls = [x.rule for x in ir_http.routing_map()._rules]
+            self.assertNotIn("/my/test/route", urls)
+            self.assertIn("/my/app/<model(app.model):foo>", urls)
+            rule, args = ir_http._endpoint_route_dispatch("/my/test/route")
+            self.assertEqual(
+                rule.endpoint.endpoint_rule_key, route1._endpoint_registry_unique_key()
+            )
+            self.assertEqual(args, {})
+            # Trailing slashes are handled as w/ `strict_slashes=False`
+            self.assertIsNone(ir_http._endpoint_route_dispatch("/my/test/route/"))
+            self.assertEqual(rule.build({})[1], "/my/test/route")
+            route3 = make_new_route(self.env, route="/my/slash/route/")
+            route3._register_controllers(options=options)
+            ir_http._endpoint_route_dispatcher_patch(
+                ir_http._endpoint_route_get_dispatcher(),
+                reg.get_rules(keys=[route3._endpoint_registry_unique_key()]),
+                reg.get_keys(),
+            )
+            for path in ("/my/slash/route/", "/my/slash/route"):
+                rule, __ = ir_http._endpoint_route_dispatch(path)
+                self.assertEqual(rule.rule, "/my/slash/route/")
+            self.assertIsNone(ir_http._endpoint_route_dispatch("/my/slash/route//"))
+            route3._unregister_controllers()
+            # Strict slashes redirect: left to the routing map
+            self.assertFalse(
+                ir_http._endpoint_route_dispatchable(
+                    "/my/slash/route/", {"strict_slashes": True}
+                )
+            )
+            self.assertIsNone(ir_http._endpoint_route_dispatch("/my/app/1"))
+            self.assertIsNone(ir_http._endpoint_route_dispatch("/my/unknown"))
+            # Other methods are left to the routing map
+            dispatcher = ir_http._endpoint_route_get_dispatcher()
+            self.assertIsNone(dispatcher.match("/my/test/route", "POST"))
+            with self._get_mocked_request(httprequest=dict(httprequest, method="POST")):
+                self.assertEqual(
+                    ir_http._endpoint_route_match("/my/test/route", lambda: "map"),
+                    "map",
+                )
+            # Patch the dispatcher
+            route1.route += "/new"
+            route1._register_controllers(options=options)
+            rules = list(reg.get_rules(keys=[route1._endpoint_registry_unique_key()]))
+            ir_http._endpoint_route_dispatcher_patch(dispatcher, rules, reg.get_keys())
+            self.assertIsNone(dispatcher.match("/my/test/route", "GET"))
+            self.assertTrue(dispatcher.match("/my/test/route/new", "GET"))
+            self.assertTrue(dispatcher.match("/my/test/route/new", "HEAD"))
+            route1._unregister_controllers()
+            ir_http._endpoint_route_dispatcher_patch(dispatcher, [], reg.get_keys())
+            self.assertIsNone(dispatcher.match("/my/test/route/new", "GET"))
+            self.assertEqual(len(dispatcher), 0)
+        with self._get_mocked_request(httprequest=httprequest):
+            # Disabled by default
+            self.assertIsNone(ir_http._endpoint_route_dispatch("/my/test/route"))
+
+    @mute_logger("odoo.addons.base.models.ir_http")
+    def test_routing_map_lazy(self):
+        options = {
+            "handler": {
+                "klass_dotted_path": CTRLFake._path,
+                "method_name": "custom_handler",
+            }
+        }
+        route1 = make_new_route(self.env)
+        route2 = make_new_route(self.env, route="/other/route")
+        route3 = make_new_route(self.env, route="/<string:foo>/lazy")
+        (route1 | route2 | route3)._register_controllers(options=options)
+        ir_http = self.env["ir.http"]
+        config = {"endpoint_route_lazy": "1"}
+
+        def map_match(path):
+            adapter = ir_http.routing_map().bind("localhost")
+            return lambda: adapter.match(path, return_rule=True)
+
+        with self._get_mocked_request(), mock.patch.dict(tools.config.options, config):
+            urls = [x.rule for x in ir_http.routing_map()._rules]
+            self.assertNotIn("/my/test/route", urls)
+            self.assertNotIn("/other/route", urls)
+            # Any prefix might match: always loaded
+            self.assertIn("/<string:foo>/lazy", urls)
+            rule, __ = map_match("/any/lazy")()
+            self.assertEqual(
+                rule.endpoint.endpoint_rule_key, route3._endpoint_registry_unique_key()
+            )
+            # Loaded on 1st miss
+            rule, __ = ir_http._endpoint_route_match(
+                "/my/test/route", map_match("/my/test/route")
+            )
+            self.assertEqual(
+                rule.endpoint.endpoint_rule_key, route1._endpoint_registry_unique_key()
+            )
+            urls = [x.rule for x in ir_http.routing_map()._rules]
+            self.assertIn("/my/test/route", urls)
+            self.assertNotIn("/other/route", urls)
+            self.assertFalse(ir_http._endpoint_route_materialize("/my/test/route"))
+            # Unknown prefix: nothing to load
+            with self.assertRaises(werkzeug.exceptions.NotFound):
+                ir_http._endpoint_route_match("/nope", map_match("/nope"))
+            self.assertEqual(ir_http._endpoint_route_loaded_prefixes, {"my"})
+            # Maps built later get loaded prefixes
+            ir_http._routing_map.clear()
+            urls = [x.rule for x in ir_http.routing_map()._rules]
+            self.assertIn("/my/test/route", urls)
+            self.assertNotIn("/other/route", urls)
+
+    @mute_logger("odoo.addons.base.models.ir_http")
+    def test_routing_map_rebuild(self):
+        options = {
+            "handler": {
+                "klass_dotted_path": CTRLFake._path,
+                "method_name": "custom_handler",
+            }
+        }
+        route1 = make_new_route(self.env)
+        route1._register_controllers(options=options)
+        ir_http = self.env["ir.http"]
+        reg = EndpointRegistry.registry_for(self.env.cr)
+        with self._get_mocked_request():
+            rmap = ir_http.routing_map()
+            rules_in_use = rmap._rules
+            odoo_urls = sorted(
+                x.rule for x in rmap._rules if not x.rule.startswith("/my/")
+            )
+            route1.route += "/new"
+            route1._register_controllers(options=options)
+            ir_http._endpoint_route_rebuild_maps(self.env.cr)
+            self.assertIs(ir_http._routing_map[None], rmap)
+            urls = [x.rule for x in rmap._rules]
+            self.assertNotIn("/my/test/route", urls)
+            self.assertIn("/my/test/route/new", urls)
+            self.assertEqual(
+                sorted(x for x in urls if not x.startswith("/my/")), odoo_urls
+            )
+            self.assertEqual(ir_http._endpoint_route_last_version, reg.last_version())
+            # Old rules are left untouched for requests still using them
+            self.assertIn("/my/test/route", [x.rule for x in rules_in_use])
+            rule, __ = rmap.bind("localhost").match(
+                "/my/test/route/new", return_rule=True
+            )
+            self.assertEqual(
+                rule.endpoint.endpoint_rule_key, route1._endpoint_registry_unique_key()
+            )
+            self.assertFalse(ir_http._endpoint_route_rebuild_async(self.env.cr.dbname))
+            config = {"endpoint_route_background_rebuild": "1"}
+            with mock.patch.dict(tools.config.options, config), mock.patch.object(
+                type(ir_http), "_endpoint_route_rebuild"
+            ) as mocked:
+                self.assertTrue(
+                    ir_http._endpoint_route_rebuild_async(self.env.cr.dbname)
+                )
+                ir_http._endpoint_route_rebuild_thread.join()
+                mocked.assert_called_once_with(self.env.cr.dbname)
+                # Only one rebuild at a time
+                self.assertTrue(
+                    ir_http._endpoint_route_rebuild_async(self.env.cr.dbname)
+                )
+                mocked.assert_called_once()
+            type(ir_http)._endpoint_route_rebuild_thread = None
+
+    @mute_logger("odoo.addons.base.models.ir_http")
+    def test_routing_map_rebuild_lazy(self):
+        options = {
+            "handler": {
+                "klass_dotted_path": CTRLFake._path,
+                "method_name": "custom_handler",
+            }
+        }
+        route1 = make_new_route(self.env)
+        route2 = make_new_route(self.env, route="/other/route")
+        (route1 | route2)._register_controllers(options=options)
+        ir_http = self.env["ir.http"]
+        rules_to_load = ir_http._endpoint_route_rules_to_load
+
+        def materialize_meanwhile(*args):
+            res = rules_to_load(*args)
+            ir_http._endpoint_route_materialize("/other/route")
+            return res
+
+        config = {"endpoint_route_lazy": "1"}
+        with self._get_mocked_request(), mock.patch.dict(tools.config.options, config):
+            ir_http.routing_map()
+            with mock.patch.object(
+                type(ir_http),
+                "_endpoint_route_rules_to_load",
+                side_effect=materialize_meanwhile,
+            ):
+                ir_http._endpoint_route_rebuild_maps(self.env.cr)
+            # The prefix loaded during the rebuild is kept
+            urls = [x.rule for x in ir_http._routing_map[None]._rules]
+            self.assertIn("/other/route", urls)
+            self.assertNotIn("/my/test/route", urls)
+
+    @mute_logger("odoo.addons.base.models.ir_http")
+    def test_benchmark_registry_scale(self):
+        # Smoke test: make sure the benchmark keeps working
+        ir_http = self.env["ir.http"]
+        with self._get_mocked_request():
+            ir_http.routing_map()
+        routing_maps = ir_http._routing_map
+        res = registry_scale.run(self.env, sizes=(5,))
+        # Maps in use are given back
+        self.assertIs(ir_http._routing_map, routing_maps)
+        self.assertEqual(res["benchmark"], "registry_scale")
+        (result,) = res["results"]
+        self.assertEqual(result["size"], 5)
+        for name in (
+            "update_rules_create",
+            "update_rules_update",
+            "get_rules",
+            "last_version",
+            "endpoint_routing_rules",
+            "routing_map_first_request",
+            "drop_rules",
+        ):
+            self.assertIsInstance(result[name], float)
+        # Nothing left behind
+        reg = EndpointRegistry.registry_for(self.env.cr)
+        self.assertFalse(list(reg.get_rules(groups=["bench_0"])))
+
+    @mute_logger("odoo.addons.base.models.ir_http")
+    def test_routing_map_notified_version(self):
+        ir_http = self.env["ir.http"]
+        config = {"endpoint_route_notify": "1"}
+        with self._get_mocked_request(), mock.patch.dict(
+            tools.config.options, config
+        ), mock.patch.object(
+            EndpointRouteVersionListener, "get_version"
+        ) as mocked_notified_version:
+            # Version not tracked: read from DB
+            mocked_notified_version.return_value = None
+            rmap = ir_http.routing_map()
+            version = ir_http._endpoint_route_last_version
+            mocked_notified_version.return_value = version
+            with mock.patch.object(
+                type(ir_http), "_get_routing_map_last_version"
+            ) as mocked_db_version:
+                self.assertIs(ir_http.routing_map(), rmap)
+                mocked_db_version.assert_not_called()
+            mocked_notified_version.return_value = version + 1
+            with mock.patch.object(
+                type(ir_http), "_get_routing_map_last_version"
+            ) as mocked_db_version:
+                mocked_db_version.return_value = version + 1
+                self.assertIsNot(ir_http.routing_map(), rmap)
+                mocked_db_version.assert_called_once()
+            self.assertEqual(ir_http._endpoint_route_last_version, version + 1)
+
 
 class TestEndpointCrossEnv(CommonEndpoint):
     def setUp(self):
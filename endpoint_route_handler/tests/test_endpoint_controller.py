@@ -4,7 +4,9 @@
 
 import os
 import unittest
+from unittest import mock
 
+from odoo import tools
 from odoo.tests.common import HttpCase
 
 from ..registry import EndpointRegistry
@@ -66,3 +68,41 @@ class EndpointHttpCase(HttpCase):
         response = self.url_open(route)
         self.assertEqual(response.status_code, 200)
         self.assertEqual(response.content, b"DEFAULT -> got: working")
+
+    def test_call_delta_update(self):
+        options = {
+            "handler": {
+                "klass_dotted_path": TestController._path,
+                "method_name": "_do_something1",
+            }
+        }
+        self.authenticate("admin", "admin")
+        ir_http = type(self.env["ir.http"])
+        config = {"endpoint_route_delta_update": "1"}
+        with mock.patch.dict(tools.config.options, config):
+            new_route = self._make_new_route(
+                route="/my/test/<string:foo>", options=options
+            )
+            response = self.url_open("/my/test/working")
+            self.assertEqual(response.status_code, 200)
+            with mock.patch.object(
+                ir_http,
+                "_generate_routing_rules",
+                wraps=ir_http._generate_routing_rules,
+            ) as mocked:
+                new_route.route = "/my/delta/<string:foo>"
+                new_route._register_controllers(options=options)
+                response = self.url_open("/my/delta/working")
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.content, b"Got: working")
+                response = self.url_open("/my/test/working")
+                self.assertEqual(response.status_code, 404)
+                # A brand new route
+                self._make_new_route(route="/my/other/<string:foo>", options=options)
+                response = self.url_open("/my/other/working")
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.content, b"Got: working")
+                response = self.url_open("/my/delta/working")
+                self.assertEqual(response.status_code, 200)
+            # Maps have been patched, not rebuilt
+            mocked.assert_not_called()
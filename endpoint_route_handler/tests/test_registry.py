@@ -2,14 +2,25 @@
 # @author: Simone Orsi <simone.orsi@camptocamp.com>
 # License LGPL-3.0 or later (http://www.gnu.org/licenses/lgpl).
 
+import time
+from unittest import mock
+
 from psycopg2 import DatabaseError
 
 from odoo import http
-from odoo.tests.common import SavepointCase, tagged
+from odoo.tests.common import SavepointCase, TransactionCase, tagged
 from odoo.tools import mute_logger
 
+from odoo.addons.base.models.ir_model import query_insert
 from odoo.addons.endpoint_route_handler.exceptions import EndpointHandlerNotFound
-from odoo.addons.endpoint_route_handler.registry import EndpointRegistry
+from odoo.addons.endpoint_route_handler.listener import EndpointRouteVersionListener
+from odoo.addons.endpoint_route_handler.registry import (
+    EndpointRegistry,
+    EndpointRule,
+    query_upsert,
+    resolve_handler,
+    route_prefix,
+)
 
 from .fake_controllers import CTRLFake
 
@@ -72,6 +83,69 @@ class TestRegistry(SavepointCase):
         last_version1 = self.reg.last_version()
         self.assertTrue(last_version1 > last_version0)
 
+    def test_last_version_per_statement(self):
+        last_version0 = self.reg.last_version()
+        rules = self._make_rules(stop=6)
+        last_version1 = self.reg.last_version()
+        self.assertEqual(last_version1, last_version0 + 1)
+        self.env.cr.execute(
+            "SELECT DISTINCT version FROM endpoint_route WHERE key IN %s",
+            (tuple([x.key for x in rules]),),
+        )
+        self.assertEqual(self.env.cr.fetchall(), [(last_version1,)])
+        self.reg.drop_rules([x.key for x in rules])
+        self.assertEqual(self.reg.last_version(), last_version1 + 1)
+
+    def test_last_group_versions(self):
+        rules_one = self._make_rules(stop=3, route_group="one")
+        rules_two = self._make_rules(start=3, stop=5, route_group="two")
+        versions = self.reg.last_group_versions()
+        self.assertTrue(versions["two"] > versions["one"])
+        last_version = self.reg.last_version()
+        self.assertEqual(self.reg.last_group_versions(since=last_version), {})
+        rules_one[0].route = "/test/1/new"
+        self.reg.update_rules(rules_one)
+        self.assertEqual(
+            self.reg.last_group_versions(since=last_version),
+            {"one": last_version + 1},
+        )
+        self.reg.drop_rules([rules_two[0].key])
+        self.assertEqual(
+            self.reg.last_group_versions(since=last_version + 1),
+            {"two": last_version + 2},
+        )
+        self.assertEqual(self.reg.get_keys(groups=["two"]), {rules_two[1].key})
+        # Moving a rule to another group changes both
+        rules_two[1].route_group = "three"
+        self.reg.update_rules([rules_two[1]])
+        self.assertEqual(
+            set(self.reg.last_group_versions(since=last_version + 2)),
+            {"two", "three"},
+        )
+
+    def test_last_group_versions_insert_only(self):
+        self._make_rules(stop=3, route_group="one")
+        last_version = self.reg.last_version()
+        # A single upsert creating new routes only
+        self._make_rules(start=3, stop=5, route_group="two")
+        self.assertEqual(self.reg.last_version(), last_version + 1)
+        self.assertEqual(
+            self.reg.last_group_versions(since=last_version),
+            {"two": last_version + 1},
+        )
+        # Creating and updating routes at once bumps the version only once
+        rules = self._make_rules(stop=6, route_group="three")
+        self.assertEqual(self.reg.last_version(), last_version + 2)
+        self.assertEqual(
+            self.reg.last_group_versions(since=last_version + 1),
+            dict.fromkeys(["one", "two", "three"], last_version + 2),
+        )
+        self.env.cr.execute(
+            "SELECT DISTINCT version FROM endpoint_route WHERE key IN %s",
+            (tuple([x.key for x in rules]),),
+        )
+        self.assertEqual(self.env.cr.fetchall(), [(last_version + 2,)])
+
     def _make_rules(self, stop=5, start=1, **kw):
         res = []
         for i in range(start, stop):
@@ -132,6 +206,39 @@ class TestRegistry(SavepointCase):
             ),
         )
 
+    def test_get_rules_stream(self):
+        self._make_rules(stop=8)
+        expected = sorted([x.key for x in self.reg.get_rules()])
+        self.assertEqual(len(expected), 7)
+        with mock.patch.object(
+            EndpointRegistry, "_stream_batch_size", 3
+        ), mock.patch.object(
+            EndpointRegistry, "_get_rules", side_effect=AssertionError
+        ):
+            rules = list(self.reg.get_rules(stream=True))
+        self.assertEqual(sorted([x.key for x in rules]), expected)
+        rules = self.reg.get_rules(keys=["route2", "route5"], stream=True)
+        self.assertEqual(sorted([x.key for x in rules]), ["route2", "route5"])
+
+    def test_get_rules_by_routing(self):
+        self._make_rules(
+            stop=3, routing={"routes": [], "auth": "public", "methods": ["GET"]}
+        )
+        self._make_rules(
+            start=3,
+            stop=5,
+            routing={"routes": [], "auth": "user_endpoint", "methods": ["POST", "PUT"]},
+        )
+        rules = list(self.reg.get_rules(routing={"auth": "public"}))
+        self.assertEqual(sorted([x.key for x in rules]), ["route1", "route2"])
+        self.assertEqual(rules[0].routing["methods"], ["GET"])
+        rules = self.reg.get_rules(routing={"methods": ["POST"]})
+        self.assertEqual(sorted([x.key for x in rules]), ["route3", "route4"])
+        rules = self.reg.get_rules(
+            keys=["route1", "route3"], routing={"auth": "public", "methods": ["GET"]}
+        )
+        self.assertEqual([x.key for x in rules], ["route1"])
+
     def test_update_rule(self):
         rule1, rule2 = self._make_rules(stop=3)
         self.assertEqual(
@@ -160,6 +267,81 @@ class TestRegistry(SavepointCase):
             self.reg._get_rule("route2").handler_options.method_name, "handler3"
         )
 
+    def test_upsert_rules(self):
+        rule1, rule2 = self._make_rules(stop=3)
+        rule1.options = {
+            "handler": {
+                "klass_dotted_path": CTRLFake._path,
+                "method_name": "handler2",
+            }
+        }
+        rule3 = self.reg.make_rule(
+            "route3",
+            "/test/3",
+            rule2.opts,
+            {"routes": []},
+            3,
+            route_group="test_route_handler",
+        )
+        created, updated = self.reg.upsert_rules([rule1, rule3])
+        self.assertEqual(created, ["route3"])
+        self.assertEqual(updated, ["route1"])
+        self.assertEqual(self._count_rules(), 3)
+        self.assertEqual(
+            self.reg._get_rule("route1").handler_options.method_name, "handler2"
+        )
+        self.assertEqual(self.reg._get_rule("route3").route, "/test/3")
+        self.assertEqual(self.reg.upsert_rules([]), ([], []))
+
+    def test_upsert_rules_unchanged(self):
+        rules = self._make_rules(stop=4)
+        last_version = self.reg.last_version()
+        last_update = self.reg.last_update()
+        # Writing the same values again is a no-op
+        self.assertEqual(self.reg.upsert_rules(rules), ([], []))
+        self.assertFalse(self.reg.update_rules(rules))
+        self.assertEqual(self.reg.last_version(), last_version)
+        self.assertEqual(self.reg.last_update(), last_update)
+        # Only the changed rule is written
+        rules[1].route = "/test/2/new"
+        self.assertEqual(self.reg.upsert_rules(rules), ([], ["route2"]))
+        self.assertEqual(self.reg.last_version(), last_version + 1)
+
+    def test_upsert_rules_pages(self):
+        rules = self._make_rules(stop=4)
+        rules[0].route = "/test/1/new"
+        rules += [
+            self.reg.make_rule(
+                f"route{i}",
+                f"/test/{i}",
+                rules[0].options,
+                rules[0].routing,
+                i,
+                route_group="test_route_handler",
+            )
+            for i in range(4, 7)
+        ]
+        res = query_upsert(
+            self.env.cr,
+            self.reg._table,
+            [rule.to_row() for rule in rules],
+            EndpointRule._ordered_columns(),
+            "key",
+            col_types=self.reg._col_types(),
+            page_size=2,
+        )
+        self.assertEqual(
+            sorted(res),
+            [
+                ("route1", False),
+                ("route4", True),
+                ("route5", True),
+                ("route6", True),
+            ],
+        )
+        self.assertEqual(self._count_rules(), 6)
+        self.assertEqual(self.reg._get_rule("route1").route, "/test/1/new")
+
     @mute_logger("odoo.sql_db")
     def test_rule_constraints(self):
         rule1, rule2 = self._make_rules(stop=3)
@@ -167,7 +349,7 @@ class TestRegistry(SavepointCase):
             'duplicate key value violates unique constraint "endpoint_route__key_uniq"'
         )
         with self.assertRaisesRegex(DatabaseError, msg), self.env.cr.savepoint():
-            self.reg._create({rule1.key: rule1.to_row()})
+            query_insert(self.env.cr, self.reg._table, [rule1.to_row()])
         msg = (
             "duplicate key value violates unique constraint "
             '"endpoint_route__endpoint_hash_uniq"'
@@ -175,7 +357,7 @@ class TestRegistry(SavepointCase):
         with self.assertRaisesRegex(DatabaseError, msg), self.env.cr.savepoint():
             rule2.endpoint_hash = rule1.endpoint_hash
             rule2.key = "key3"
-            self.reg._create({rule2.key: rule2.to_row()})
+            query_insert(self.env.cr, self.reg._table, [rule2.to_row()])
 
     def test_drop_rule(self):
         rules = self._make_rules(stop=3)
@@ -211,6 +393,39 @@ class TestRegistry(SavepointCase):
         self.assertTrue(isinstance(rule.endpoint, http.EndPoint))
         self.assertEqual(rule.endpoint(), ("one", 2))
 
+    def test_endpoint_lookup_cached(self):
+        resolve_handler.cache_clear()
+        rules = self._make_rules(stop=5)
+        endpoints = [rule.endpoint for rule in rules]
+        cache_info = resolve_handler.cache_info()
+        self.assertEqual(cache_info.misses, 1)
+        self.assertEqual(cache_info.hits, 3)
+        # All the rules share the same controller
+        self.assertEqual(len({x.method.func.__self__ for x in endpoints}), 1)
+        self.assertEqual([x("one") for x in endpoints], [("one", 2)] * 4)
+
+    def test_rule_interned_options(self):
+        self._make_rules(stop=4)
+        rule1, rule2, rule3 = sorted(self.reg.get_rules(), key=lambda x: x.key)
+        # Same strings are shared
+        self.assertIs(
+            rule1.handler_options.klass_dotted_path,
+            rule2.handler_options.klass_dotted_path,
+        )
+        self.assertIs(rule1.route_group, rule3.route_group)
+        # Options are not copied on access
+        self.assertIs(rule1.options, rule1.opts)
+        self.assertIs(rule1.handler_options, rule1.opts["handler"])
+        self.assertEqual(rule1.handler_options.method_name, "handler1")
+        rule1.options = {
+            "handler": {
+                "klass_dotted_path": CTRLFake._path,
+                "method_name": "handler2",
+            }
+        }
+        self.assertEqual(rule1.handler_options.method_name, "handler2")
+        self.assertEqual(rule2.handler_options.method_name, "handler1")
+
     def test_get_rule_by_group(self):
         self.assertEqual(self._count_rules(), 0)
         self._make_rules(stop=4, route_group="one")
@@ -220,3 +435,96 @@ class TestRegistry(SavepointCase):
         self.assertEqual([rule.key for rule in rules], ["route1", "route2", "route3"])
         rules = self.reg.get_rules_by_group("two")
         self.assertEqual([rule.key for rule in rules], ["route5", "route6"])
+        rules = self.reg.get_rules_by_group(["one", "two"])
+        self.assertEqual(
+            sorted([rule.key for rule in rules]),
+            ["route1", "route2", "route3", "route5", "route6"],
+        )
+        self.assertEqual(list(self.reg.get_rules_by_group([])), [])
+        # Group names are passed as query parameters
+        self.assertEqual(list(self.reg.get_rules_by_group("one' OR 'a'='a")), [])
+
+    def test_get_rules_by_prefix(self):
+        self.assertEqual(route_prefix("/test/1"), "test")
+        self.assertEqual(route_prefix("/test"), "test")
+        self.assertEqual(route_prefix("/"), "")
+        self._make_rules(stop=3)
+        self._make_rules(start=3, stop=5, route="/other/route")
+        self.assertEqual(
+            sorted(rule.key for rule in self.reg.get_rules(prefixes=["test"])),
+            ["route1", "route2"],
+        )
+        self.assertEqual(
+            sorted(rule.key for rule in self.reg.get_rules(prefixes=["other", "no"])),
+            ["route3", "route4"],
+        )
+        self.assertTrue({"test", "other"}.issubset(self.reg.get_route_prefixes()))
+
+    def test_version_listener(self):
+        listener = EndpointRouteVersionListener()
+        listener._versions["foo"] = 5
+        conn = mock.Mock(
+            notifies=[
+                mock.Mock(payload="10"),
+                mock.Mock(payload="8"),
+                mock.Mock(payload="nope"),
+            ]
+        )
+        with mute_logger("odoo.addons.endpoint_route_handler.listener"):
+            listener._process("foo", conn)
+        conn.poll.assert_called_once()
+        self.assertEqual(listener._versions["foo"], 10)
+        self.assertEqual(conn.notifies, [])
+
+
+@tagged("-at_install", "post_install")
+class TestVersionListener(TransactionCase):
+    """Notifications are delivered on commit: changes are committed here."""
+
+    def setUp(self):
+        super().setUp()
+        self.listener = EndpointRouteVersionListener()
+        self.key = "test_version_listener"
+
+    def tearDown(self):
+        with self.registry.cursor() as cr:
+            EndpointRegistry.registry_for(cr).drop_rules([self.key])
+            cr.execute(
+                "DELETE FROM endpoint_route_group_version WHERE route_group = %s",
+                (self.key,),
+            )
+        self.listener._forget(self.env.cr.dbname)
+        super().tearDown()
+
+    def _wait_for_version(self, dbname, version, timeout=5.0):
+        deadline = time.time() + timeout
+        while self.listener.get_version(dbname) <= version:
+            if time.time() > deadline:
+                break
+            time.sleep(0.1)
+        return self.listener.get_version(dbname)
+
+    def test_new_route_notified(self):
+        dbname = self.env.cr.dbname
+        version = self.listener.get_version(dbname)
+        self.assertIsNotNone(version)
+        with self.registry.cursor() as cr:
+            reg = EndpointRegistry.registry_for(cr)
+            options = {
+                "handler": {
+                    "klass_dotted_path": CTRLFake._path,
+                    "method_name": "handler1",
+                }
+            }
+            rule = reg.make_rule(
+                self.key,
+                "/test/version/listener",
+                options,
+                {"routes": []},
+                self.key,
+                route_group=self.key,
+            )
+            # Brand new route only
+            self.assertEqual(reg.upsert_rules([rule]), ([self.key], []))
+            new_version = reg.last_version()
+        self.assertEqual(self._wait_for_version(dbname, version), new_version)